@@ -0,0 +1,372 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark suite for the dMFA and MRIO computations on synthetic inputs of
+configurable size. Every stage is timed (best of `repeat` runs) and, in a separate
+traced run, its peak Python/NumPy allocation is recorded with tracemalloc. Results
+are written as JSON to Benchmarks/Results so that runs can be compared over time.
+
+    python benchmark.py                  # quick grid
+    python benchmark.py --preset full    # 91-1000 steps, 1-500 classes, 1-10,000 draws, 50-8000 sectors
+    python benchmark.py --compare old.json new.json
+"""
+
+import argparse
+import datetime
+import gc
+import json
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import scipy
+
+sys.path.insert(0, str(Path(__file__).parents[1] / 'dMFA'))
+
+from dmfa_model import (read_inputs, _write_input_cache, _read_input_cache, class_shares,
+                        titanium_per_plane_by_class, project_stock, survival_curve, compact_survival,
+                        solve_inflow, vintage_matrix, cohort_stock, solve_inflow_batch, convolve_cohorts,
+                        run_scenario, BASELINE)
+from dmfa_store import export_excel, save_results
+
+sys.path.insert(0, str(Path(__file__).parents[1] / 'MRIO'))
+
+from mrio_leontief import LeontiefSystem
+
+RESULTS_DIR = Path(__file__).parent / 'Results'
+
+# Size grids: dMFA (horizon steps, classes), ensemble (horizon steps, draws), IO sectors
+PRESETS = {
+    'quick': {
+        'dmfa': [(91, 1), (91, 50), (300, 50)],
+        'ensemble': [(91, 1), (91, 1000)],
+        'io': [50, 500],
+    },
+    'full': {
+        'dmfa': [(steps, classes) for steps in (91, 250, 500, 1000) for classes in (1, 50, 500)],
+        'ensemble': [(steps, draws) for steps in (91, 1000) for draws in (1, 100, 10000)],
+        'io': [50, 500, 2000, 8000],
+    },
+}
+
+FIRST_OBSERVED, LAST_OBSERVED = 2000, 2023
+
+
+#%% Synthetic inputs
+
+def synthetic_inputs(n_steps=91, n_classes=5, start_year=1970, seed=0):
+    """
+    Inputs in the layout of dmfa_model.read_inputs for an annual horizon of
+    `n_steps` years and `n_classes` aircraft classes.
+    """
+    rng = np.random.default_rng(seed)
+    years = np.arange(start_year, start_year + n_steps)
+    observed_years = np.arange(FIRST_OBSERVED, LAST_OBSERVED + 1)
+    classes = [f'Class {i + 1}' for i in range(n_classes)]
+
+    stock = pd.Series(np.linspace(3500, 6500, len(observed_years)) + rng.normal(0, 50, len(observed_years)),
+                      index=pd.Index(observed_years, name='Year'), name='stock')
+    shares = rng.dirichlet(np.ones(n_classes), size=len(observed_years))
+    stock_by_class = pd.DataFrame(shares, index=observed_years, columns=classes)
+    weight_by_class = pd.Series(rng.uniform(20, 250, n_classes), index=classes, name='Weight')
+    titanium_share_matrix = pd.DataFrame(rng.uniform(0.05, 0.15, (n_steps, n_classes)), index=years, columns=classes)
+    return {
+        'stock': stock,
+        'stock_by_class': stock_by_class,
+        'weight_by_class': weight_by_class,
+        'titanium_share_matrix': titanium_share_matrix,
+    }
+
+
+def write_input_workbook(inputs, path):
+    """Write synthetic inputs as a stock workbook that read_inputs can parse."""
+    with pd.ExcelWriter(path, engine='xlsxwriter') as writer:
+        inputs['stock'].rename('Stock (nº of planes)').reset_index().to_excel(
+            writer, sheet_name='Stock of planes in EU27', index=False)
+        inputs['stock_by_class'].to_excel(writer, sheet_name='Stock by class')
+        inputs['weight_by_class'].to_frame().to_excel(writer, sheet_name='Weight by class')
+        inputs['titanium_share_matrix'].to_excel(writer, sheet_name='Titanium by vintage')
+
+
+def synthetic_io(n_sectors=500, n_regions=None, n_demand=7, seed=0):
+    """
+    Flow tables Z, Y, V, E and total output X of a consistent synthetic MRIO system
+    indexed (Region, Level, Item) as in MARIO. Region 'EU27' holds the titanium
+    sector. Coefficient columns sum to 0.2-0.8, so I - z is invertible.
+    """
+    rng = np.random.default_rng(seed)
+    n_regions = n_regions or max(1, min(49, n_sectors // 50))
+    per_region = n_sectors // n_regions
+    regions = ['EU27'] + [f'R{i}' for i in range(1, n_regions)]
+    sectors = ['Manufacturing of Titanium and articles thereof'] + [f'Sector {i}' for i in range(1, per_region)]
+    index = pd.MultiIndex.from_product([regions, ['Sector'], sectors], names=['Region', 'Level', 'Item'])
+    n = len(index)
+
+    z = rng.random((n, n))
+    z *= rng.uniform(0.2, 0.8, n) / z.sum(axis=0)
+    y = rng.uniform(1, 100, (n, n_regions * n_demand))
+    x = np.linalg.solve(np.eye(n) - z, y.sum(axis=1))
+
+    demand = pd.MultiIndex.from_product([regions, ['Consumption category'], [f'Demand {i}' for i in range(n_demand)]],
+                                        names=['Region', 'Level', 'Item'])
+    value_added = x - (z * x).sum(axis=0)
+    V = pd.DataFrame(value_added[None], index=['Value added'], columns=index)
+    E = pd.DataFrame(rng.uniform(0.001, 0.02, (2, n)) * x, index=['Employment people', 'Emissions'], columns=index)
+    return {
+        'Z': pd.DataFrame(z * x, index=index, columns=index),
+        'Y': pd.DataFrame(y, index=index, columns=demand),
+        'V': V,
+        'E': E,
+        'X': pd.DataFrame(x, index=index, columns=['production']),
+    }
+
+
+#%% Stages
+
+def dmfa_stages(n_steps, n_classes, tmp, seed=0):
+    """Stage functions of one stock-driven run over `n_steps` years and `n_classes` classes."""
+    inputs = synthetic_inputs(n_steps, n_classes, seed=seed)
+    years = np.arange(1970, 1970 + n_steps)
+    scenario = {**BASELINE, 'name': 'Benchmark', 'end_year': int(years[-1])}
+    stock = project_stock(years, inputs['stock'], curve_mean_forecast=LAST_OBSERVED + n_steps // 5)
+    survival = compact_survival(years, [(1970, 25, 12.5), (2030, 35, 12.5)])
+    inflow = solve_inflow(stock, survival, cohort=False).inflow
+
+    workbook, cache = tmp / 'Stock input data.xlsx', tmp / 'inputs.npz'
+    write_input_workbook(inputs, workbook)
+    _write_input_cache(inputs, cache)
+    results = run_scenario(scenario, inputs, vintage_matrices=True)
+
+    def titanium_aggregation():
+        shares = class_shares(inputs['stock_by_class'], years)
+        ti_per_plane = titanium_per_plane_by_class(shares, inputs['weight_by_class'], inputs['titanium_share_matrix'])
+        inflow_by_class = ti_per_plane.fillna(0).to_numpy(dtype=np.float32).T * inflow.astype(np.float32)
+        return cohort_stock(inflow_by_class, survival)
+
+    return {
+        'input_load': lambda: read_inputs(workbook),
+        'input_load_cached': lambda: _read_input_cache(cache),
+        'inflow_solve': lambda: solve_inflow(stock, survival, cohort=False),
+        'cohort_build': lambda: vintage_matrix(inflow, survival),
+        'titanium_aggregation': titanium_aggregation,
+        'export_excel': lambda: export_excel(results, tmp / 'results.xlsx'),
+        'export_sqlite': lambda: save_results(results, tmp / 'results.sqlite'),
+    }
+
+
+def ensemble_stages(n_steps, n_draws, tmp, seed=0):
+    """Stage functions of a batched ensemble of `n_draws` draws over `n_steps` years."""
+    inputs = synthetic_inputs(n_steps, 1, seed=seed)
+    rng = np.random.default_rng(seed)
+    years = np.arange(1970, 1970 + n_steps)
+    stock = project_stock(years, inputs['stock'], stock_target=rng.uniform(7000, 9000, n_draws),
+                          curve_mean_forecast=LAST_OBSERVED + n_steps // 5)
+    curves = survival_curve(n_steps, rng.normal(25, 2.5, n_draws), rng.uniform(10, 15, n_draws))
+    stock, curves = np.broadcast_arrays(np.atleast_2d(stock), np.atleast_2d(curves))
+    inflow, _ = solve_inflow_batch(stock, curves)
+    return {
+        'inflow_solve': lambda: solve_inflow_batch(stock, curves),
+        'cohort_build': lambda: convolve_cohorts(inflow, curves),
+    }
+
+
+def io_stages(n_sectors, tmp, seed=0):
+    """
+    Stage functions of the MRIO extraction in `MRIO/Exiobase parsing.py` on a synthetic
+    system: coefficients, LU-factored Leontief model and output, EU27 indicators, export. The
+    n x n sheets of the flows workbook are left out of the export, which otherwise
+    dominates the run at every size.
+    """
+    io = synthetic_io(n_sectors, seed=seed)
+    titanium = ('EU27', 'Sector', 'Manufacturing of Titanium and articles thereof')
+    state = {}
+
+    def coefficients():
+        x = io['X']['production']
+        state['z'] = io['Z'] / x.to_numpy()
+        state['v'] = io['V'] / x.to_numpy()
+        state['e'] = io['E'] / x.to_numpy()
+
+    def leontief_solve():
+        state['leontief'] = LeontiefSystem(state['z'], state['v'], state['e'])
+        state['X'] = state['leontief'].output(io['Y'].sum(axis=1)).to_frame('production')
+
+    def extract():
+        X, v, e = state['X'], state['v'], state['e']
+        x_EU = X.loc[pd.IndexSlice['EU27', :, :], :].squeeze()
+        v_EU = v.loc[:, pd.IndexSlice['EU27', :, :]].squeeze()
+        e_EU = e.loc['Employment people', pd.IndexSlice['EU27', :, :]].squeeze()
+        state['indicators'] = {
+            'Output (x)': float(X.loc[titanium].iloc[0]),
+            'Value Added (v)': float(v.loc[:, titanium].iloc[0]),
+            'Employment (e)': float(e.loc['Employment people', titanium]),
+            'Total VA for EU': float((v_EU * x_EU).sum()),
+            'Total Emp for EU': float((x_EU * e_EU).sum()),
+            'Multiplier (w)': state['leontief'].element(titanium, titanium),
+        }
+
+    def export():
+        with pd.ExcelWriter(tmp / 'Indicators.xlsx', engine='xlsxwriter') as writer:
+            pd.Series(state['indicators']).rename_axis('Metric').rename('Value').to_frame().to_excel(
+                writer, sheet_name='Summary')
+            state['X'].to_excel(writer, sheet_name='X')
+            state['v'].to_excel(writer, sheet_name='ValueAdded_v')
+
+    return {
+        'io_coefficients': coefficients,
+        'leontief_solve': leontief_solve,
+        'io_extract': extract,
+        'io_export': export,
+    }
+
+
+SUITES = {
+    'dmfa': (dmfa_stages, ('steps', 'classes')),
+    'ensemble': (ensemble_stages, ('steps', 'draws')),
+    'io': (io_stages, ('sectors',)),
+}
+
+
+#%% Runner
+
+def time_stage(function, repeat=3, memory=True):
+    """Best and all wall times of `repeat` runs, plus the tracemalloc peak (MB) of one extra run."""
+    times = []
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+
+    peak = None
+    if memory:
+        gc.collect()
+        tracemalloc.start()
+        function()
+        peak = tracemalloc.get_traced_memory()[1] / 2 ** 20
+        tracemalloc.stop()
+    return {'seconds': min(times), 'runs': times, 'peak_mb': peak}
+
+
+def _peak_memory(records):
+    """
+    Peak resident memory of this process (MB) and where it comes from: getrusage
+    where the resource module exists (POSIX), psutil otherwise (peak working set on
+    Windows), else the largest tracemalloc peak of the stages.
+    """
+    try:
+        import resource
+    except ImportError:
+        pass
+    else:
+        max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return max_rss / 2 ** (20 if sys.platform == 'darwin' else 10), 'getrusage'  # bytes on macOS, KB elsewhere
+
+    try:
+        import psutil
+    except ImportError:
+        pass
+    else:
+        info = psutil.Process().memory_info()
+        return getattr(info, 'peak_wset', info.rss) / 2 ** 20, 'psutil'
+
+    peaks = [record['peak_mb'] for record in records if record['peak_mb'] is not None]
+    return (max(peaks), 'tracemalloc') if peaks else (None, None)
+
+
+def _metadata():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=Path(__file__).parent,
+                                capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        'date': datetime.datetime.now().isoformat(timespec='seconds'),
+        'commit': commit,
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'scipy': scipy.__version__,
+        'pandas': pd.__version__,
+        'machine': platform.platform(),
+    }
+
+
+def run_benchmarks(grid=None, repeat=3, memory=True, seed=0, verbose=True):
+    """
+    Run every suite of `grid` (see PRESETS; default 'quick'). Returns the report
+    as a dict: metadata, the grid and one record per case and stage.
+    """
+    grid = PRESETS['quick'] if grid is None else grid
+    records = []
+    for suite, cases in grid.items():
+        build, size_names = SUITES[suite]
+        for case in cases:
+            case = case if isinstance(case, (tuple, list)) else (case,)
+            size = dict(zip(size_names, case))
+            with tempfile.TemporaryDirectory(prefix='benchmark ') as tmp:
+                stages = build(*case, tmp=Path(tmp), seed=seed)
+                for stage, function in stages.items():
+                    record = {'suite': suite, 'size': size, 'stage': stage, **time_stage(function, repeat, memory)}
+                    records.append(record)
+                    if verbose:
+                        peak = '' if record['peak_mb'] is None else f"{record['peak_mb']:10.1f} MB"
+                        print(f"{suite:9} {str(size):36} {stage:22} {record['seconds']:10.4f} s {peak}", flush=True)
+                del stages
+    max_rss, source = _peak_memory(records)
+    return {
+        'metadata': {**_metadata(), 'max_rss_mb': max_rss, 'max_rss_source': source},
+        'grid': grid,
+        'results': records,
+    }
+
+
+def save_report(report, path=None):
+    """Write a report as JSON, by default to Results/benchmark <date>.json."""
+    if path is None:
+        RESULTS_DIR.mkdir(exist_ok=True)
+        path = RESULTS_DIR / f"benchmark {report['metadata']['date'].replace(':', '-')}.json"
+    Path(path).write_text(json.dumps(report, indent=1))
+    return Path(path)
+
+
+def report_table(report):
+    """Results of a report as a DataFrame indexed by (suite, size, stage)."""
+    table = pd.DataFrame(report['results'])
+    table['size'] = table['size'].map(lambda size: ', '.join(f'{k}={v}' for k, v in size.items()))
+    return table.set_index(['suite', 'size', 'stage'])[['seconds', 'peak_mb']]
+
+
+def compare_reports(old, new):
+    """Time and memory of two saved reports side by side, with new/old ratios."""
+    old, new = (report_table(json.loads(Path(path).read_text())) for path in (old, new))
+    table = old.join(new, lsuffix='_old', rsuffix='_new', how='outer')
+    table['time_ratio'] = table['seconds_new'] / table['seconds_old']
+    table['memory_ratio'] = table['peak_mb_new'] / table['peak_mb_old']
+    return table
+
+
+#%% Command line
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark suite for the dMFA and MRIO computations.')
+    parser.add_argument('--preset', choices=sorted(PRESETS), default='quick')
+    parser.add_argument('--suites', nargs='+', choices=sorted(SUITES), help='run only these suites')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--no-memory', action='store_true', help='skip the traced run for memory peaks')
+    parser.add_argument('--out', type=Path, help='JSON file (default: Results/benchmark <date>.json)')
+    parser.add_argument('--compare', nargs=2, type=Path, metavar=('OLD', 'NEW'), help='compare two saved reports')
+    args = parser.parse_args()
+
+    if args.compare:
+        with pd.option_context('display.max_rows', None, 'display.width', 200):
+            print(compare_reports(*args.compare).round(4))
+    else:
+        grid = {suite: cases for suite, cases in PRESETS[args.preset].items()
+                if args.suites is None or suite in args.suites}
+        report = run_benchmarks(grid, args.repeat, not args.no_memory)
+        print(f'Saved {save_report(report, args.out)}')
@@ -8,45 +8,72 @@ Created on Tue May  6 15:44:16 2025
 
 import pandas as pd
 import numpy as np
+import sys
 import mario
 from pathlib import Path
 
+sys.path.insert(0, str(Path(__file__).parents[1] / 'dMFA'))
+from pipeline_profile import stage  # per-stage timings with PIPELINE_PROFILE=1
+from mrio_cache import store_database
+from mrio_aggregation import load_aggregations
+
 #%% 1. Create MARIO database by parsing Exiobase 2019
 IOT_2019_ixi = Path(__file__).parent/'IOT_2019_ixi.zip'
 print("Exists?", IOT_2019_ixi.exists())
 
-mrio = mario.parse_exiobase_3(path=IOT_2019_ixi, calc_all=True, year=2019, name='IOT_2019')
+with stage('parse_exiobase_3'):
+    mrio = mario.parse_exiobase_3(path=IOT_2019_ixi, calc_all=True, year=2019, name='IOT_2019')
 
 mrio # check MARIO properties
 
+# Parsed tables to the binary cache (mrio_cache.load_exiobase reads them without the zip)
+store_database(mrio, [IOT_2019_ixi])
+
 
 #%% 2. Get aggregation excel through excel
 Aggregation_module = Path(__file__).parent/'Aggregation module.xlsx'
 #mrio.get_aggregation_excel(Aggregation_module)
 
 #%% 3. Import aggregation excel
-mrio.aggregate(Aggregation_module, ignore_nan=True)
+with stage('aggregate'):
+    mrio.aggregate(Aggregation_module, ignore_nan=True)
 
 mrio # Check and compare properties
 
+# MARIO's aggregated tables to the binary cache, keyed by the zip and the aggregation
+# workbook (the sparse engine below stores its own results under a separate key)
+store_database(mrio, [IOT_2019_ixi, Aggregation_module])
+
 print(mrio.Z)
 
+#%% 3b. Alternative aggregations in one pass over the parsed tables
+# Sparse concordances (mrio_aggregation), compiled once per workbook and cached, run
+# on the parsed tables stored in step 1; the MARIO aggregation above is only needed
+# for the MARIO exports below. Add further aggregation workbooks to compare them
+# without parsing EXIOBASE again
+Aggregation_alternatives = [Aggregation_module]
+
+with stage('aggregate alternatives'):
+    alternatives = load_aggregations(IOT_2019_ixi, Aggregation_alternatives, year=2019)
+
 #%% 4. Export aggregated dataset in txt format
 
 path_txt_aggr = Path(__file__).parent /'IOT aggregated'
 
-mrio.to_txt(path=path_txt_aggr,
-            flows= True,
-            coefficients= True, 
-            #unit=True, # Indicated as arguement in the API, but not in this function
-            sep=',')
+with stage('to_txt'):
+    mrio.to_txt(path=path_txt_aggr,
+                flows= True,
+                coefficients= True, 
+                #unit=True, # Indicated as arguement in the API, but not in this function
+                sep=',')
 
 #%% Export in excel format
 
 path_exc_aggr = Path(__file__).parent / 'IOT_Aggregated_July.xlsx'
 
-mrio.to_excel(path=path_exc_aggr,
-            flows= True,
-            coefficients= True, 
-            #unit=True, # Indicated as arguement in the API, but not in this function
-            )
\ No newline at end of file
+with stage('to_excel'):
+    mrio.to_excel(path=path_exc_aggr,
+                flows= True,
+                coefficients= True, 
+                #unit=True, # Indicated as arguement in the API, but not in this function
+                )
\ No newline at end of file
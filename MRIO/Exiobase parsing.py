@@ -6,41 +6,60 @@ Created on Thu Jun 19 16:25:28 2025
 @author: stefanoghirlandi
 """
 
+import sys
 import pandas as pd
 import mario
 from pathlib import Path
 
+sys.path.insert(0, str(Path(__file__).parents[1] / 'dMFA'))
+from pipeline_profile import stage  # per-stage timings with PIPELINE_PROFILE=1
+from mrio_cache import cached_tables
+from mrio_tables import IOTables
+from mrio_multipliers import multipliers, TITANIUM_SECTORS
+
 #% Create MARIO database through txt 
 #IOT_aggregated = Path(__file__).parent /'Baseline.xlsx'
 #IOT_aggregated = Path(__file__).parent / 'Recycling' / 'Input recycling - coefficients.xlsx'
 IOT_aggregated = Path(__file__).parent /'LTE'/'LTE - coefficients - lower imports.xlsx'
 
-mrio = mario.parse_from_excel(path=str(IOT_aggregated), 
-                            table='IOT', 
-                            #mode='flows',
-                            mode='coefficients',
-                            calc_all=True,
-                            )
+def parse():
+    return mario.parse_from_excel(path=str(IOT_aggregated), 
+                                  table='IOT', 
+                                  #mode='flows',
+                                  mode='coefficients',
+                                  calc_all=False,
+                                  )
+
+# Matrices from the binary cache (mrio_cache), keyed by the workbook content:
+# the workbook is only parsed again after it changes
+with stage('parse_from_excel'):
+    tables = cached_tables([IOT_aggregated], parse, names=['Z', 'Y', 'V', 'E', 'X', 'z', 'v', 'e'])
 
 #%
-Z = mrio.Z
-Y = mrio.Y #Final demand
-V = mrio.V
-X = mrio.X #Total output
-z = mrio.z
-w = mrio.w #Leontieff inverse
-v = mrio.v #Value added
-e = mrio.e #Satellite accounts
-f = mrio.f #footprint coefficients
+Z = tables['Z']
+Y = tables['Y'] #Final demand
+V = tables['V']
+X = tables['X'] #Total output
+z = tables['z']
+v = tables['v'] #Value added
+e = tables['e'] #Satellite accounts
+
+# Sparse tables on integer-coded indexes (mrio_tables): region and sector slices
+# resolve through the codes, and Z, z, v, e are held as CSR/CSC matrices
+io = IOTables.from_tables(tables)
+
+# Leontief model: (I - z) is factored once, the inverse is never formed for the queries
+leontief = io.leontief()
 
-x_EU = X.loc[pd.IndexSlice['EU27', :, :], :] 
-x_EU = x_EU.squeeze()
+EU = io.index[pd.IndexSlice['EU27', :, :]]
+TIT = io.index.get_loc(pd.IndexSlice['EU27', 'Sector', 'Manufacturing of Titanium and articles thereof'])
+EMPLOYMENT = io.accounts.get_loc('Employment people')
 
-v_EU = v.loc[:, pd.IndexSlice['EU27', :, :]]
-v_EU = v_EU.squeeze()
+x_EU = io.x[EU]
 
-e_EU = e.loc['Employment people', pd.IndexSlice['EU27', :, :]]
-e_EU = e_EU.squeeze()
+v_EU = io.v[:, EU].toarray().squeeze()
+
+e_EU = io.e[EMPLOYMENT, EU].toarray().squeeze()
 
 x_EU_total = x_EU.sum()
 
@@ -52,24 +71,13 @@ print(VA_EU, Emp_EU, x_EU_total)
 
 #%% Find x, v and e corresponding to Titanium in EU27
 
-x_EU_tit = float(X.loc[
-    pd.IndexSlice['EU27', 'Sector', 'Manufacturing of Titanium and articles thereof'], :
-])
+x_EU_tit = float(io.x[TIT])
 
-v_EU_tit = float(v.loc[
-    :, 
-    pd.IndexSlice['EU27', 'Sector', 'Manufacturing of Titanium and articles thereof']
-])
+v_EU_tit = io.v[:, TIT].sum()
 
-e_EU_tit = float(e.loc[
-    pd.IndexSlice['Employment people'],
-    pd.IndexSlice['EU27', 'Sector', 'Manufacturing of Titanium and articles thereof']
-])
+e_EU_tit = io.e[EMPLOYMENT, TIT]
 
-w_EU_tit = float(w.loc[
-    pd.IndexSlice['EU27', 'Sector', 'Manufacturing of Titanium and articles thereof'], 
-    pd.IndexSlice['EU27', 'Sector', 'Manufacturing of Titanium and articles thereof']
-])
+w_EU_tit = leontief.element(TIT, TIT)
 
 #%% Value added and employement
 value_added = x_EU_tit * v_EU_tit
@@ -77,22 +85,38 @@ employment = x_EU_tit * e_EU_tit
 
 print(value_added, employment, x_EU_tit)
 
-#%%
-path = Path(__file__).parent / "Baseline scenario - coefficients.xlsx"
-mrio.to_excel(path=path,
-              coefficients=True,
-              )
+#%% Multipliers and linkages of titanium in every region
+# Only the Leontief columns of the titanium sectors are solved (mrio_multipliers)
+titanium_multipliers = multipliers(leontief).table(TITANIUM_SECTORS, x=io.x)
+print(titanium_multipliers)
+
+#%% MARIO workbook of the database (needs the MARIO object, so the workbook is parsed again)
+export_mario_workbook = False
+if export_mario_workbook:
+    path = Path(__file__).parent / "Baseline scenario - coefficients.xlsx"
+    with stage('to_excel coefficients'):
+        parse().to_excel(path=path,
+                         coefficients=True,
+                         )
 #%%
 Output = Path(__file__).parent / "Flows and coefficients.xlsx"
 
-with pd.ExcelWriter(Output, engine="xlsxwriter") as writer:
+# Leontief columns of the titanium sectors, by one multi-RHS solve; the full dense
+# inverse (n^2 cells, O(n^3) to form) only on request
+export_full_inverse = False
+if export_full_inverse:
+    leontief_w = leontief.inverse()
+else:
+    leontief_w = leontief.columns(io.index[TITANIUM_SECTORS])
+
+with stage('export flows and coefficients'), pd.ExcelWriter(Output, engine="xlsxwriter") as writer:
     Z.to_excel(writer, sheet_name="Z")
     Y.to_excel(writer, sheet_name="Y")
     V.to_excel(writer, sheet_name="V")   
     X.to_excel(writer, sheet_name="X")
     z.to_excel(writer, sheet_name="Intermediate coeff_z")
     v.to_excel(writer, sheet_name="ValueAdded_v")
-    w.to_excel(writer, sheet_name="Leontief_w")
+    leontief_w.to_excel(writer, sheet_name="Leontief_w")
     
 #%% Prepare the data
 # Convert each emission Series to DataFrame with index as colum
@@ -107,4 +131,5 @@ scalar_df = pd.DataFrame({
 Indicators = Path(__file__).parent / "EU27__Indicators_LTE.xlsx"
 
 with pd.ExcelWriter(Indicators) as writer:
-    scalar_df.to_excel(writer, sheet_name='Summary', index=False)
\ No newline at end of file
+    scalar_df.to_excel(writer, sheet_name='Summary', index=False)
+    titanium_multipliers.to_excel(writer, sheet_name='Titanium multipliers')
\ No newline at end of file
@@ -0,0 +1,265 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Aggregation of IO tables by sparse concordance matrices. A MARIO aggregation
+workbook (one sheet per level, original items in the index, new names in the
+'Aggregation' column) is compiled once into 0/1 concordances C for sectors, final
+demand, factors and satellite accounts, cached next to the parsed tables, and the
+flows are aggregated as sparse products (C^T Z C, C^T Y D, F^T V C, G^T E C).
+Several aggregations share one pass over the source: Z is multiplied by all the
+sector concordances side by side.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+from pathlib import Path
+from typing import NamedTuple
+
+import numpy as np
+import pandas as pd
+import scipy.sparse
+
+from mrio_cache import CACHE_DIR, FLOWS, cache_entry, file_digest, load_exiobase, load_tables, save_tables
+from mrio_tables import IOTables, SectorIndex
+
+# Items aggregated to these names are removed, as in mario.Database.aggregate
+DROP = ['unused']
+
+# Cache tag of the tables aggregated here, kept apart from those aggregated by MARIO
+ENGINE = 'sparse'
+
+_AXES = ['sectors', 'demand', 'factors', 'accounts']
+
+
+#%% Concordances
+
+class Concordance(NamedTuple):
+    """0/1 matrix (source x target) mapping `source` labels to `target` labels."""
+    source: pd.Index
+    target: pd.Index
+    matrix: scipy.sparse.csr_matrix
+
+
+class Aggregation(NamedTuple):
+    """Concordances of one aggregation workbook, with its per-level mappings (for units)."""
+    sectors: Concordance
+    demand: Concordance = None
+    factors: Concordance = None
+    accounts: Concordance = None
+    mappings: dict = None
+
+
+def read_aggregation(path, ignore_nan=True):
+    """
+    Mapping original -> aggregated name per level (sheet) of an aggregation workbook.
+    Empty cells keep the original name with `ignore_nan`, otherwise they are an error.
+    """
+    mappings = {}
+    for level, sheet in pd.read_excel(path, sheet_name=None, index_col=0).items():
+        mapping = sheet['Aggregation'] if 'Aggregation' in sheet else sheet.iloc[:, 0]
+        missing = mapping.isna()
+        if missing.any() and not ignore_nan:
+            raise ValueError(f"sheet {level!r} has no aggregation for {list(mapping.index[missing])}")
+        mappings[level] = mapping.where(~missing, mapping.index.to_series())
+    return mappings
+
+
+def _map(mappings, level, labels):
+    """Aggregated names of `labels` at `level` (unchanged when the workbook has no such sheet)."""
+    if level not in mappings:
+        return list(labels)
+    mapping = mappings[level]
+    unknown = pd.Index(labels).difference(mapping.index)
+    if len(unknown):
+        raise KeyError(f"aggregation sheet {level!r} misses {list(unknown)}")
+    return list(mapping[labels])
+
+
+def _concordance(source, targets, drop):
+    """Concordance from the target label of every source row (dropped labels map to nothing)."""
+    keep = np.array([not any(part in drop for part in (t if isinstance(t, tuple) else (t,))) for t in targets],
+                    dtype=bool)
+    kept = [t for t, k in zip(targets, keep) if k]
+    if isinstance(source, pd.MultiIndex):
+        target = pd.MultiIndex.from_tuples(sorted(set(kept)), names=source.names)
+    else:
+        target = pd.Index(sorted(set(kept)), name=source.name)
+    columns = target.get_indexer(kept)
+    matrix = scipy.sparse.csr_matrix((np.ones(len(kept)), (np.flatnonzero(keep), columns)),
+                                     shape=(len(source), len(target)))
+    return Concordance(source, target, matrix)
+
+
+def _index_concordance(index, mappings, drop):
+    """Concordance for a (Region, Level, Item) index: regions and items of each level mapped."""
+    regions, levels, items = (index.get_level_values(i) for i in range(3))
+    new_regions = _map(mappings, 'Region', regions)
+    new_items = list(items)
+    for level in pd.unique(levels):
+        rows = np.flatnonzero(levels == level)
+        for row, item in zip(rows, _map(mappings, level, items[rows])):
+            new_items[row] = item
+    return _concordance(index, list(zip(new_regions, levels, new_items)), drop)
+
+
+def compile_aggregation(workbook, tables, ignore_nan=True, drop=DROP):
+    """Concordances of `workbook` for the axes of `tables` (IOTables)."""
+    mappings = read_aggregation(workbook, ignore_nan)
+    concordances = {
+        'sectors': _index_concordance(tables.index.labels(), mappings, drop),
+        'demand': None if tables.demand is None else _index_concordance(tables.demand.labels(), mappings, drop),
+    }
+    for axis, level, labels in [('factors', 'Factor of production', tables.factors),
+                                ('accounts', 'Satellite account', tables.accounts)]:
+        concordances[axis] = None if labels is None else _concordance(labels, _map(mappings, level, labels), drop)
+    return Aggregation(**concordances, mappings=mappings)
+
+
+#%% Cache of compiled concordances
+
+def _labels_digest(tables):
+    meta = [tables.index.meta(), None if tables.demand is None else tables.demand.meta(),
+            None if tables.factors is None else tables.factors.tolist(),
+            None if tables.accounts is None else tables.accounts.tolist()]
+    return hashlib.sha256(json.dumps(meta).encode()).hexdigest()
+
+
+def cached_aggregation(workbook, tables, ignore_nan=True, drop=DROP, cache_dir=CACHE_DIR):
+    """
+    compile_aggregation, stored in cache_dir/Concordances under the digests of the
+    workbook and of the source labels, so each workbook is read from Excel once.
+    """
+    key = f'{Path(workbook).stem} - {file_digest(workbook, cache_dir)[:16]} - {_labels_digest(tables)[:16]}'
+    entry = Path(cache_dir) / 'Concordances' / f'{key}{" nan" if ignore_nan else ""} {"+".join(drop)}'
+    if (entry / 'meta.json').exists():
+        meta = json.loads((entry / 'meta.json').read_text())
+        sources = {'sectors': tables.index.labels(), 'factors': tables.factors, 'accounts': tables.accounts,
+                   'demand': None if tables.demand is None else tables.demand.labels()}
+        concordances = {}
+        for axis in _AXES:
+            if axis in meta['targets']:
+                target = SectorIndex.from_meta(meta['targets'][axis]).labels()
+                if target.nlevels == 1:
+                    target = target.get_level_values(0)
+                concordances[axis] = Concordance(sources[axis], target, scipy.sparse.load_npz(entry / f'{axis}.npz'))
+        mappings = {level: pd.Series(mapping) for level, mapping in meta['mappings'].items()}
+        return Aggregation(**concordances, mappings=mappings)
+
+    aggregation = compile_aggregation(workbook, tables, ignore_nan, drop)
+    entry.parent.mkdir(parents=True, exist_ok=True)
+    tmp = Path(tempfile.mkdtemp(dir=entry.parent, prefix='.tmp '))
+    meta = {'targets': {}, 'mappings': {level: mapping.to_dict() for level, mapping in aggregation.mappings.items()}}
+    for axis in _AXES:
+        concordance = getattr(aggregation, axis)
+        if concordance is not None:
+            scipy.sparse.save_npz(tmp / f'{axis}.npz', concordance.matrix)
+            meta['targets'][axis] = SectorIndex.from_index(concordance.target).meta()
+    (tmp / 'meta.json').write_text(json.dumps(meta))
+    if entry.exists():
+        shutil.rmtree(entry)
+    os.replace(tmp, entry)
+    return aggregation
+
+
+#%% Aggregation
+
+def _split(product, concordances):
+    """Column blocks of `product` (source matrix times the concordances side by side)."""
+    bounds = np.cumsum([0] + [c.matrix.shape[1] for c in concordances])
+    return [product[:, a:b] for a, b in zip(bounds[:-1], bounds[1:])]
+
+
+def _right(matrix, concordances):
+    """matrix @ C_i for every concordance, as one sparse product."""
+    if matrix is None or any(c is None for c in concordances):
+        return [None] * len(concordances)
+    stacked = scipy.sparse.hstack([c.matrix for c in concordances], format='csr')
+    return _split((scipy.sparse.csr_matrix(matrix) @ stacked).tocsc(), concordances)
+
+
+def _left(concordance, matrix):
+    """C^T @ matrix (rows of `matrix` aggregated), or `matrix` itself without a concordance."""
+    if matrix is None:
+        return None
+    return matrix.tocsr() if concordance is None else (concordance.matrix.T @ matrix).tocsr()
+
+
+def _aggregate_units(units, mappings):
+    if not units:
+        return None
+    aggregated = {}
+    for level, table in units.items():
+        if level in mappings:
+            table = table.groupby(_map(mappings, level, table.index), sort=True).first()
+        aggregated[level] = table
+    return aggregated
+
+
+def aggregate_many(tables, aggregations):
+    """
+    Aggregate IOTables with several Aggregations ({name: Aggregation}) in one pass:
+    every source matrix is multiplied once by the concordances of all aggregations
+    side by side. Returns {name: IOTables}; coefficients are recomputed from the
+    aggregated flows.
+    """
+    names = list(aggregations)
+    sectors = [aggregations[name].sectors for name in names]
+    demand = [aggregations[name].demand for name in names]
+
+    Z = _right(tables.flow('Z'), sectors)
+    V = _right(tables.flow('V'), sectors)
+    E = _right(tables.flow('E'), sectors)
+    Y = _right(tables.Y, demand)
+    EY = _right(tables.EY, demand)
+    x = tables.x if tables.x is not None else np.asarray(tables.flow('Z').sum(axis=1)).ravel()
+    x_all = np.concatenate([s.matrix.T @ x for s in sectors])
+    x_split = np.split(x_all, np.cumsum([s.matrix.shape[1] for s in sectors])[:-1])
+
+    results = {}
+    for i, name in enumerate(names):
+        aggregation = aggregations[name]
+        concordance = aggregation.sectors
+        results[name] = IOTables.from_flows(
+            SectorIndex.from_index(concordance.target),
+            x_split[i].astype(Z[i].dtype),
+            Z=_left(concordance, Z[i]),
+            Y=_left(concordance, Y[i]),
+            V=_left(aggregation.factors, V[i]),
+            E=_left(aggregation.accounts, E[i]),
+            EY=_left(aggregation.accounts, EY[i]),
+            demand=None if aggregation.demand is None else SectorIndex.from_index(aggregation.demand.target),
+            factors=tables.factors if aggregation.factors is None else aggregation.factors.target,
+            accounts=tables.accounts if aggregation.accounts is None else aggregation.accounts.target,
+            units=_aggregate_units(tables.units, aggregation.mappings or {}),
+        )
+    return results
+
+
+def aggregate(tables, aggregation):
+    """Aggregate IOTables with one Aggregation."""
+    return aggregate_many(tables, {'aggregation': aggregation})['aggregation']
+
+
+#%% EXIOBASE
+
+def load_aggregations(path, workbooks, year=None, names=FLOWS, cache_dir=CACHE_DIR, mmap=True, **parse_kwargs):
+    """
+    EXIOBASE 3 tables from the zip at `path` for several aggregation workbooks, as
+    {workbook stem: tables}. Aggregations not cached yet are computed together in
+    one pass over the parsed tables (themselves cached, see mrio_cache). They are
+    stored under their own cache key, next to any MARIO aggregation of the same files.
+    """
+    entries = {Path(w).stem: (w, cache_entry([path, w], cache_dir, ENGINE)) for w in workbooks}
+    missing = {stem: w for stem, (w, entry) in entries.items() if not (entry / 'meta.json').exists()}
+    if missing:
+        source = IOTables.from_tables(load_exiobase(path, year, names=FLOWS, cache_dir=cache_dir, **parse_kwargs))
+        aggregations = {stem: cached_aggregation(w, source, cache_dir=cache_dir) for stem, w in missing.items()}
+        for stem, aggregated in aggregate_many(source, aggregations).items():
+            tables = aggregated.to_tables(['X', 'Z', 'Y', 'V', 'E', 'EY'])
+            if aggregated.units:
+                tables['units'] = aggregated.units
+            save_tables(tables, entries[stem][1])
+    return {stem: load_tables(entry, names, mmap) for stem, (w, entry) in entries.items()}
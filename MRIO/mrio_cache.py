@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Binary cache for parsed and aggregated EXIOBASE databases. The matrices (Z, Y, V,
+E, EY, X, optionally coefficients) are stored as .npy files with the index metadata
+in JSON, in one folder per source: the EXIOBASE zip or workbook, plus the
+aggregation workbook when aggregated, each identified by its content hash. Cached
+tables load memory-mapped, so a later run needs neither MARIO nor the zip.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+CACHE_DIR = Path(__file__).parent / 'Cache'
+
+# Flow tables stored by default; coefficient tables (z, v, e, w, f) can be added
+FLOWS = ['Z', 'Y', 'V', 'E', 'EY', 'X']
+
+_DIGESTS = 'digests.json'
+
+
+#%% Keys
+
+def file_digest(path, cache_dir=CACHE_DIR):
+    """
+    SHA-256 of a file's content. Digests are remembered by (size, modification time)
+    in cache_dir, so a multi-GB zip is only hashed again after it changes.
+    """
+    path = Path(path).resolve()
+    stat = path.stat()
+    memo_file = Path(cache_dir) / _DIGESTS
+    memo = json.loads(memo_file.read_text()) if memo_file.exists() else {}
+    known = memo.get(str(path))
+    if known and known[:2] == [stat.st_size, stat.st_mtime_ns]:
+        return known[2]
+
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(2 ** 24), b''):
+            digest.update(chunk)
+    memo[str(path)] = [stat.st_size, stat.st_mtime_ns, digest.hexdigest()]
+    memo_file.parent.mkdir(parents=True, exist_ok=True)
+    _write_atomic(memo_file, json.dumps(memo, indent=1))
+    return digest.hexdigest()
+
+
+def cache_entry(sources, cache_dir=CACHE_DIR, engine=None):
+    """
+    Cache folder for a list of source files: '<stem> - <hash>' per source, joined by
+    ' + ', followed by ' [<engine>]' for tables not produced by MARIO itself.
+    """
+    name = ' + '.join(f'{Path(s).stem} - {file_digest(s, cache_dir)[:16]}' for s in sources)
+    return Path(cache_dir) / (name if engine is None else f'{name} [{engine}]')
+
+
+#%% Tables <-> files
+
+def _index_meta(index):
+    return {'names': list(index.names), 'values': [list(v) if isinstance(v, tuple) else v for v in index.tolist()]}
+
+
+def _index(meta):
+    if len(meta['names']) > 1:
+        return pd.MultiIndex.from_tuples([tuple(v) for v in meta['values']], names=meta['names'])
+    return pd.Index(meta['values'], name=meta['names'][0])
+
+
+def _write_atomic(path, text):
+    fd, tmp = tempfile.mkstemp(dir=path.parent, suffix='.tmp')
+    with os.fdopen(fd, 'w') as f:
+        f.write(text)
+    os.replace(tmp, path)
+
+
+def save_tables(tables, entry):
+    """
+    Write DataFrames as <name>.npy plus meta.json (index, columns, units). The folder
+    is written under a temporary name and renamed, so readers never see a partial entry.
+    """
+    entry = Path(entry)
+    entry.parent.mkdir(parents=True, exist_ok=True)
+    tmp = Path(tempfile.mkdtemp(dir=entry.parent, prefix='.tmp '))
+    meta = {'tables': {}}
+    for name, table in tables.items():
+        if name == 'units':
+            meta['units'] = {level: units.to_dict(orient='split') for level, units in table.items()}
+            continue
+        np.save(tmp / f'{name}.npy', np.ascontiguousarray(table.to_numpy(dtype=float)))
+        meta['tables'][name] = {'index': _index_meta(table.index), 'columns': _index_meta(table.columns)}
+    (tmp / 'meta.json').write_text(json.dumps(meta))
+
+    if entry.exists():
+        shutil.rmtree(entry)
+    os.replace(tmp, entry)
+    return entry
+
+
+def load_tables(entry, names=None, mmap=True):
+    """Read a cache folder back into DataFrames (memory-mapped, read-only with `mmap`)."""
+    entry = Path(entry)
+    meta = json.loads((entry / 'meta.json').read_text())
+    tables = {}
+    for name, axes in meta['tables'].items():
+        if names is not None and name not in names:
+            continue
+        values = np.load(entry / f'{name}.npy', mmap_mode='r' if mmap else None)
+        tables[name] = pd.DataFrame(values, index=_index(axes['index']), columns=_index(axes['columns']), copy=False)
+    if 'units' in meta:
+        tables['units'] = {level: pd.DataFrame(**units) for level, units in meta['units'].items()}
+    return tables
+
+
+def database_tables(database, names=FLOWS):
+    """Tables of a MARIO Database (attributes such as Z, Y, X), with its units when available."""
+    tables = {name: getattr(database, name) for name in names}
+    units = getattr(database, 'units', None)
+    if units:
+        tables['units'] = units
+    return tables
+
+
+#%% Cached parsing
+
+def cached_tables(sources, build, names=FLOWS, cache_dir=CACHE_DIR, mmap=True):
+    """
+    Tables for the given source files from the cache, or from `build()` (a MARIO
+    Database or a dict of DataFrames) on a miss, which are then stored. An entry
+    that lacks some of `names` counts as a miss and is extended with them.
+    """
+    entry = cache_entry(sources, cache_dir)
+    stored = _stored_names(entry)
+    if stored is None or not set(names) <= stored:
+        built = build()
+        tables = built if isinstance(built, dict) else database_tables(built, names)
+        absent = [name for name in names if name not in tables]
+        if absent:
+            raise KeyError(f"build() for {[Path(s).name for s in sources]} did not provide {absent}")
+        if stored:
+            tables = {**load_tables(entry, mmap=False), **tables}
+        save_tables(tables, entry)
+    return load_tables(entry, names, mmap)
+
+
+def _stored_names(entry):
+    """Names of the tables in a cache folder, or None when there is no entry."""
+    meta_file = Path(entry) / 'meta.json'
+    if not meta_file.exists():
+        return None
+    return set(json.loads(meta_file.read_text())['tables'])
+
+
+def store_database(database, sources, names=FLOWS, cache_dir=CACHE_DIR):
+    """Store the tables of a Database already in memory under the key of `sources`."""
+    return save_tables(database_tables(database, names), cache_entry(sources, cache_dir))
+
+
+def load_exiobase(path, year=None, aggregation=None, names=FLOWS, cache_dir=CACHE_DIR, mmap=True, **parse_kwargs):
+    """
+    EXIOBASE 3 tables from the zip at `path`, aggregated with the MARIO aggregation
+    workbook `aggregation` when given (by the sparse concordances of mrio_aggregation).
+    Only on a cache miss is MARIO imported and the zip parsed; both the parsed and the
+    aggregated tables are stored.
+    """
+    if aggregation is not None:
+        from mrio_aggregation import load_aggregations  # imports this module
+        return load_aggregations(path, [aggregation], year, names, cache_dir, mmap, **parse_kwargs)[Path(aggregation).stem]
+
+    def parse():
+        import mario
+        return mario.parse_exiobase_3(path=path, calc_all=False, year=year, **parse_kwargs)
+
+    return cached_tables([path], parse, names, cache_dir, mmap)
+
+
+def clear_cache(cache_dir=CACHE_DIR):
+    """Remove every cached entry (the digest memo is kept)."""
+    for entry in Path(cache_dir).iterdir():
+        if entry.is_dir():
+            shutil.rmtree(entry)
@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Leontief model solved by LU factorization. (I - A) is factored once, sparse (SuperLU)
+or dense (LAPACK), and output, value added and employment are obtained for any
+demand vectors or selected Leontief columns by triangular solves. The full inverse
+is only built on request.
+"""
+
+import copy
+
+import numpy as np
+import pandas as pd
+import scipy.linalg
+import scipy.sparse
+import scipy.sparse.linalg
+
+# Above this share of non-zeros a dense factorization is faster than SuperLU
+DENSE_THRESHOLD = 0.1
+
+# Shocks of higher rank than this share of the sectors are refactored instead of updated
+MAX_UPDATE_RANK = 0.1
+
+
+def _values(table):
+    if scipy.sparse.issparse(table):
+        return table
+    return table.to_numpy(dtype=float) if isinstance(table, (pd.DataFrame, pd.Series)) else np.asarray(table, dtype=float)
+
+
+class Factorization:
+    """LU factors of a square matrix M, solving M x = b or M^T x = b for one or many right-hand sides."""
+
+    def __init__(self, M, sparse=None):
+        n = M.shape[0]
+        if sparse is None:
+            nnz = M.nnz if scipy.sparse.issparse(M) else np.count_nonzero(M)
+            sparse = nnz / n ** 2 < DENSE_THRESHOLD
+        self.sparse = sparse
+        if sparse:
+            self._lu = scipy.sparse.linalg.splu(scipy.sparse.csc_matrix(M))
+        else:
+            M = M.toarray() if scipy.sparse.issparse(M) else M
+            self._lu = scipy.linalg.lu_factor(M, check_finite=False)
+
+    def solve(self, b, transpose=False):
+        b = np.asarray(b, dtype=float)
+        if self.sparse:
+            return self._lu.solve(b, trans='T' if transpose else 'N')
+        return scipy.linalg.lu_solve(self._lu, b, trans=1 if transpose else 0, check_finite=False)
+
+
+class LowRankUpdate:
+    """
+    Solves with M - U V^T from the factors of M (Sherman-Morrison-Woodbury):
+    (M - U V^T)^-1 b = M^-1 b + M^-1 U (I - V^T M^-1 U)^-1 V^T M^-1 b.
+    Costs k solves with M up front (k = rank of the update), then one solve with M
+    and a k x k solve per right-hand side.
+    """
+
+    def __init__(self, factors, U, V):
+        self.factors, self.U, self.V = factors, U, V
+        self.sparse = factors.sparse
+        self._MU = factors.solve(U)
+        self._capacitance = scipy.linalg.lu_factor(np.eye(U.shape[1]) - V.T @ self._MU, check_finite=False)
+        self._MtV = None
+
+    def solve(self, b, transpose=False):
+        if not transpose:
+            y = self.factors.solve(b)
+            return y + self._MU @ scipy.linalg.lu_solve(self._capacitance, self.V.T @ y, check_finite=False)
+        # (M - U V^T)^T = M^T - V U^T, whose capacitance matrix is the transpose of the above
+        if self._MtV is None:
+            self._MtV = self.factors.solve(self.V, transpose=True)
+        y = self.factors.solve(b, transpose=True)
+        return y + self._MtV @ scipy.linalg.lu_solve(self._capacitance, self.U.T @ y, trans=1, check_finite=False)
+
+
+def low_rank(delta):
+    """
+    Factors U, V (n x k) with delta = U V^T, over the non-zero columns of `delta`
+    or its non-zero rows, whichever are fewer.
+    """
+    delta = scipy.sparse.csc_matrix(delta)
+    delta.eliminate_zeros()
+    rows, cols = delta.nonzero()
+    rows, cols = np.unique(rows), np.unique(cols)
+    n = delta.shape[0]
+    if len(cols) <= len(rows):
+        unit = np.zeros((n, len(cols)))
+        unit[cols, np.arange(len(cols))] = 1.0
+        return delta[:, cols].toarray(), unit
+    unit = np.zeros((n, len(rows)))
+    unit[rows, np.arange(len(rows))] = 1.0
+    return unit, delta[rows, :].toarray().T
+
+
+class LeontiefSystem:
+    """
+    Input-output system x = (I - A)^-1 y with value-added coefficients `v` (factors x
+    sectors) and satellite coefficients `e` (accounts x sectors). Tables may be
+    DataFrames (labels are kept in the results), arrays or sparse matrices.
+    """
+
+    def __init__(self, A, v=None, e=None, index=None, sparse=None):
+        self.index = A.index if isinstance(A, pd.DataFrame) else index
+        self.v = v
+        self.e = e
+        self.A = _values(A)
+        self.n_sectors = self.A.shape[0]
+        self.factors = Factorization(self._identity() - self.A, sparse)
+
+    def _identity(self):
+        return scipy.sparse.identity(self.n_sectors, format='csc') if scipy.sparse.issparse(self.A) else np.eye(self.n_sectors)
+
+    @classmethod
+    def from_tables(cls, tables, sparse=None):
+        """System from MARIO-style tables: coefficients z, v, e if present, else Z, V, E over X."""
+        x = tables['X'].squeeze(axis=1).to_numpy(dtype=float)
+        safe_x = np.where(x != 0, x, 1.0)
+
+        def coefficients(coefficient, flow):
+            if coefficient in tables:
+                return tables[coefficient]
+            return tables[flow] / safe_x if flow in tables else None
+
+        return cls(coefficients('z', 'Z'), coefficients('v', 'V'), coefficients('e', 'E'), sparse=sparse)
+
+    # === Scenarios ===
+
+    def shocked(self, delta_A=None, v=None, e=None, max_rank=MAX_UPDATE_RANK):
+        """
+        System with coefficients A + delta_A (sparse, array or DataFrame on the same
+        index) and optionally new `v` / `e`. The baseline factors are reused through a
+        low-rank (Woodbury) update; shocks touching more than `max_rank` x sectors
+        rows and columns are refactored instead.
+        """
+        system = copy.copy(self)
+        system.v = self.v if v is None else v
+        system.e = self.e if e is None else e
+        if delta_A is None:
+            return system
+
+        if isinstance(delta_A, pd.DataFrame) and self.index is not None:
+            delta_A = delta_A.reindex(index=self.index, columns=self.index, fill_value=0)
+        delta = scipy.sparse.csc_matrix(_values(delta_A))
+        system.A = self.A + delta if scipy.sparse.issparse(self.A) else self.A + delta.toarray()
+        U, V = low_rank(delta)
+        if U.shape[1] == 0:
+            return system
+        if U.shape[1] > max_rank * self.n_sectors:
+            system.factors = Factorization(system._identity() - system.A, self.factors.sparse)
+        else:
+            # A shocked system can be shocked again: the updates nest
+            system.factors = LowRankUpdate(self.factors, U, V)
+        return system
+
+    # === Labels ===
+
+    def locate(self, sectors):
+        """Positions of one or several sectors, given as index labels (tuples) or positions."""
+        if isinstance(sectors, (tuple, str)) or np.isscalar(sectors):
+            sectors = [sectors]
+        if self.index is None or all(isinstance(s, (int, np.integer)) for s in sectors):
+            return np.asarray(sectors, dtype=int)
+        positions = self.index.get_indexer(sectors)
+        if (positions < 0).any():
+            raise KeyError(f"unknown sectors: {[s for s, p in zip(sectors, positions) if p < 0]}")
+        return positions
+
+    def _unit(self, positions):
+        unit = np.zeros((self.n_sectors, len(positions)))
+        unit[positions, np.arange(len(positions))] = 1.0
+        return unit, self.index[positions] if self.index is not None else None
+
+    def _label(self, values, columns=None):
+        """Wrap sector-indexed results in pandas when the system has an index."""
+        if self.index is None:
+            return values
+        if values.ndim == 1:
+            return pd.Series(values, index=self.index)
+        return pd.DataFrame(values, index=self.index, columns=columns)
+
+    # === Queries ===
+
+    def output(self, demand):
+        """Total output x for a demand vector or a (sectors x cases) demand matrix."""
+        columns = demand.columns if isinstance(demand, pd.DataFrame) else None
+        return self._label(self.factors.solve(_values(demand)), columns)
+
+    def value_added(self, demand, x=None):
+        """Value added by factor and sector (v * x) for the given demand, or for output `x`."""
+        return self._satellite(self.v, demand, x)
+
+    def employment(self, demand, x=None, account='Employment people'):
+        """Satellite account `account` by sector (e * x) for the given demand, or for output `x`."""
+        e = self.e.loc[[account]] if isinstance(self.e, pd.DataFrame) else self.e
+        return self._satellite(e, demand, x)
+
+    def _satellite(self, coefficients, demand, x):
+        x = self.output(demand) if x is None else x
+        x_values = _values(x)
+        c = _values(coefficients)
+        if x_values.ndim == 1:
+            values = c.multiply(x_values) if scipy.sparse.issparse(c) else c * x_values
+            if isinstance(coefficients, pd.DataFrame):
+                return pd.DataFrame(np.asarray(values), index=coefficients.index, columns=coefficients.columns)
+            return values
+        # Several cases: totals per row of the coefficient table and case
+        totals = c @ x_values
+        if isinstance(coefficients, pd.DataFrame):
+            return pd.DataFrame(totals, index=coefficients.index, columns=getattr(x, 'columns', None))
+        return totals
+
+    def columns(self, sectors):
+        """Leontief columns (I - A)^-1 e_j for the selected sectors, by one multi-RHS solve."""
+        unit, columns = self._unit(self.locate(sectors))
+        return self._label(self.factors.solve(unit), columns)
+
+    def rows(self, sectors):
+        """Leontief rows e_i^T (I - A)^-1 for the selected sectors (transposed solve), sectors x columns."""
+        unit, columns = self._unit(self.locate(sectors))
+        return self._label(self.factors.solve(unit, transpose=True), columns).T
+
+    def element(self, row, column):
+        """Single element of the Leontief inverse."""
+        return float(_values(self.columns(column))[self.locate(row)[0], 0])
+
+    def inverse(self):
+        """Full Leontief inverse (dense); O(n^3), only for exports or small systems."""
+        return self._label(self.factors.solve(np.eye(self.n_sectors)), self.index)
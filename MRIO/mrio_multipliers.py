@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Targeted multiplier and linkage queries on a factorized LeontiefSystem: output,
+value-added and employment multipliers, backward and forward linkages, for chosen
+sectors only. Each query solves just the Leontief columns it needs (or one
+right-hand side for row sums) and keeps them, one memo per scenario (system).
+"""
+
+import weakref
+
+import numpy as np
+import pandas as pd
+
+from mrio_leontief import _values
+from mrio_tables import SectorIndex
+
+EMPLOYMENT = 'Employment people'
+
+TITANIUM_SECTORS = pd.IndexSlice[:, 'Sector', 'Manufacturing of Titanium and articles thereof']
+
+_queries = weakref.WeakKeyDictionary()
+
+
+def multipliers(system):
+    """
+    The Multipliers of `system`, shared by all callers while the system is alive. The
+    memo holds the system only weakly: keep a reference to the system while querying.
+    """
+    if system not in _queries:
+        _queries[system] = Multipliers(system)
+    return _queries[system]
+
+
+class Multipliers:
+    """
+    Queries on one system. Leontief columns L e_j are solved on first use, several
+    at a time, and reused by every later query on the same sectors; row sums L 1
+    (for forward linkages and the normalization) cost one solve.
+    """
+
+    def __init__(self, system):
+        # Weak, so that the memo in multipliers() does not keep the system (and its factors) alive
+        self._system = weakref.ref(system)
+        self._columns = {}
+        self._row_sums = {}
+        self._sector_index = None
+
+    @property
+    def system(self):
+        system = self._system()
+        if system is None:
+            raise ReferenceError("the LeontiefSystem of these multipliers no longer exists")
+        return system
+
+    # === Sectors ===
+
+    def locate(self, sectors):
+        """Positions of sectors given as labels, positions or a pd.IndexSlice key such as TITANIUM_SECTORS."""
+        if isinstance(sectors, tuple) and any(isinstance(s, slice) or s is Ellipsis for s in sectors):
+            if self._sector_index is None:
+                self._sector_index = SectorIndex.from_index(self.system.index)
+            return self._sector_index[sectors]
+        return self.system.locate(sectors)
+
+    def _labels(self, positions):
+        return self.system.index[positions] if self.system.index is not None else pd.Index(positions)
+
+    def columns(self, sectors):
+        """Leontief columns (sectors x selected), solving only those not yet known."""
+        positions = self.locate(sectors)
+        missing = [j for j in dict.fromkeys(positions.tolist()) if j not in self._columns]
+        if missing:
+            unit = np.zeros((self.system.n_sectors, len(missing)))
+            unit[missing, np.arange(len(missing))] = 1.0
+            solved = self.system.factors.solve(unit)
+            self._columns.update(zip(missing, solved.T))
+        return np.column_stack([self._columns[j] for j in positions])
+
+    def row_sums(self, weights=None):
+        """L w for w = 1 (Leontief row sums) or given weights such as output x (Ghosh)."""
+        key = None if weights is None else id(weights)
+        if key not in self._row_sums:
+            w = np.ones(self.system.n_sectors) if weights is None else _values(weights).ravel()
+            self._row_sums[key] = (weights, self.system.factors.solve(w))
+        return self._row_sums[key][1]
+
+    # === Coefficients ===
+
+    def _value_added(self):
+        return np.asarray(_values(self.system.v).sum(axis=0)).ravel()
+
+    def _satellite(self, account):
+        e = self.system.e.loc[[account]] if isinstance(self.system.e, pd.DataFrame) else self.system.e
+        return np.asarray(_values(e)).ravel()
+
+    def _weighted(self, coefficients, sectors, by_region):
+        positions = self.locate(sectors)
+        generated = coefficients[:, None] * self.columns(positions)
+        labels = self._labels(positions)
+        if not by_region:
+            return pd.Series(generated.sum(axis=0), index=labels)
+        regions = self.system.index.get_level_values(0)
+        return pd.DataFrame(generated, index=regions, columns=labels).groupby(level=0, sort=True).sum()
+
+    # === Multipliers ===
+
+    def output(self, sectors=TITANIUM_SECTORS, by_region=False):
+        """Output multipliers: total output per unit of final demand for each sector (1^T L e_j)."""
+        return self._weighted(np.ones(self.system.n_sectors), sectors, by_region)
+
+    def value_added(self, sectors=TITANIUM_SECTORS, by_region=False):
+        """Value-added multipliers v^T L e_j, by region of origin with `by_region`."""
+        return self._weighted(self._value_added(), sectors, by_region)
+
+    def employment(self, sectors=TITANIUM_SECTORS, account=EMPLOYMENT, by_region=False):
+        """Employment (satellite `account`) multipliers e^T L e_j, by region of origin with `by_region`."""
+        return self._weighted(self._satellite(account), sectors, by_region)
+
+    # === Linkages ===
+
+    def backward_linkages(self, sectors=TITANIUM_SECTORS, normalized=True):
+        """
+        Column sums of L for the sectors; normalized by the average over all
+        sectors (1^T L 1 / n), so that values above 1 mark strong backward linkage.
+        """
+        linkages = self.output(sectors)
+        if normalized:
+            linkages = linkages / (self.row_sums().sum() / self.system.n_sectors)
+        return linkages
+
+    def forward_linkages(self, sectors=TITANIUM_SECTORS, x=None, normalized=True):
+        """
+        Row sums of the Leontief inverse (L 1)_i, or of the Ghosh inverse (L x)_i / x_i
+        when output `x` is given; normalized by their average over all sectors.
+        """
+        positions = self.locate(sectors)
+        if x is None:
+            sums = self.row_sums()
+        else:
+            x_values = _values(x).ravel()
+            sums = np.divide(self.row_sums(x), x_values, out=np.zeros_like(x_values), where=x_values != 0)
+        linkages = pd.Series(sums[positions], index=self._labels(positions))
+        return linkages / sums.mean() if normalized else linkages
+
+    # === Tables ===
+
+    def table(self, sectors=TITANIUM_SECTORS, account=EMPLOYMENT, x=None):
+        """Multipliers and normalized linkages of the sectors, one row per sector."""
+        return pd.DataFrame({
+            'output_multiplier': self.output(sectors),
+            'value_added_multiplier': self.value_added(sectors),
+            'employment_multiplier': self.employment(sectors, account),
+            'backward_linkage': self.backward_linkages(sectors),
+            'forward_linkage': self.forward_linkages(sectors, x),
+        })
+
+    def footprints(self, demand, sectors=TITANIUM_SECTORS, account=EMPLOYMENT):
+        """
+        Output, value added and employment embodied in the final demand of each of
+        the sectors (multiplier x demand of that sector), over the whole economy.
+        """
+        positions = self.locate(sectors)
+        y = _values(demand).ravel()[positions]
+        return pd.DataFrame({
+            'final_demand': y,
+            'output': self.output(positions).to_numpy() * y,
+            'value_added': self.value_added(positions).to_numpy() * y,
+            'employment': self.employment(positions, account).to_numpy() * y,
+        }, index=self._labels(positions))
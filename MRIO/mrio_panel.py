@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Multi-year EXIOBASE 3 ingestion. Each local year archive (IOT_<year>_ixi.zip) is
+read straight from the zip, streamed in row blocks into sparse matrices, aggregated
+with the same workbook (mrio_aggregation) and reduced to a few indicators (x, v.x,
+e.x) for the chosen sectors and regions. Years are processed in parallel worker
+processes, one year per worker process, and stacked into one panel.
+"""
+
+import re
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import scipy.sparse
+
+from mrio_aggregation import aggregate, cached_aggregation
+from mrio_cache import CACHE_DIR, cache_entry
+from mrio_tables import BLOCK_ROWS, IOTables, SectorIndex
+
+# Stressors of the EXIOBASE 3 satellite F that are value added (taxes, compensation
+# of employees, operating surplus): MARIO's factors of production
+FACTOR_PREFIXES = ('Taxes less subsidies', 'Other net taxes', 'Compensation of employees', 'Operating surplus')
+
+# Satellite account of the aggregated tables (see the aggregation workbook)
+ACCOUNTS = ('Employment people',)
+
+TITANIUM_SECTORS = pd.IndexSlice[:, 'Sector', 'Manufacturing of Titanium and articles thereof']
+
+
+#%% Reading the archives
+
+def find_archives(folder, years=None, pattern='IOT_*_ixi.zip'):
+    """{year: path} of the EXIOBASE archives in `folder` (optionally only `years`)."""
+    archives = {}
+    for path in sorted(Path(folder).glob(pattern)):
+        year = int(re.search(r'\d{4}', path.stem).group())
+        if years is None or year in years:
+            archives[year] = path
+    return archives
+
+
+def _member(archive, name):
+    for member in archive.namelist():
+        if member == name or member.endswith('/' + name):
+            return member
+    raise KeyError(f"{name} not found in {archive.filename}")
+
+
+def _read_member(archive, name, index_col, header, dtype, block):
+    """Tab-separated table of the archive, streamed `block` rows at a time into CSR."""
+    index, blocks, columns = [], [], None
+    with archive.open(_member(archive, name)) as f:
+        for chunk in pd.read_csv(f, sep='\t', index_col=index_col, header=header, chunksize=block):
+            columns = chunk.columns
+            index.append(chunk.index)
+            blocks.append(scipy.sparse.csr_matrix(chunk.to_numpy(dtype=dtype)))
+    return index[0].append(index[1:]), columns, scipy.sparse.vstack(blocks, format='csr')
+
+
+def _labels(pairs, level):
+    """(region, item) pairs as the (Region, Level, Item) index used by MARIO."""
+    regions, items = pairs.get_level_values(0), pairs.get_level_values(1)
+    return pd.MultiIndex.from_arrays([regions, [level] * len(pairs), items], names=['Region', 'Level', 'Item'])
+
+
+def read_exiobase_zip(path, dtype=np.float64, block=BLOCK_ROWS, factor_prefixes=FACTOR_PREFIXES):
+    """
+    Flow tables (Z, Y, x, V, E, EY) of an EXIOBASE 3 ixi archive, without extracting
+    it. Stressors whose names start with one of `factor_prefixes` are the factors of
+    production (V), the others the satellite accounts (E, EY). Only the flows are
+    kept; coefficients are computed after aggregation.
+    """
+    with zipfile.ZipFile(path) as archive:
+        sectors, _, Z = _read_member(archive, 'Z.txt', [0, 1], [0, 1], dtype, block)
+        _, demand, Y = _read_member(archive, 'Y.txt', [0, 1], [0, 1], dtype, block)
+        _, _, x = _read_member(archive, 'x.txt', [0, 1], 0, dtype, block)
+        stressors, _, F = _read_member(archive, 'satellite/F.txt', 0, [0, 1], dtype, block)
+        _, _, FY = _read_member(archive, 'satellite/F_Y.txt', 0, [0, 1], dtype, block)
+
+    stressors = pd.Index(stressors)
+    factor = np.asarray(stressors.str.startswith(factor_prefixes), dtype=bool)
+    if not factor.any():
+        raise ValueError(f"no stressor of {path} starts with {factor_prefixes}")
+
+    return IOTables(
+        SectorIndex.from_index(_labels(sectors, 'Sector')),
+        x.toarray().ravel(),
+        demand=SectorIndex.from_index(_labels(demand, 'Consumption category')),
+        factors=stressors[factor],
+        accounts=stressors[~factor],
+        Z=Z, Y=Y, V=F[factor], E=F[~factor], EY=FY[~factor],
+    )
+
+
+def year_tables(path, aggregation=None, dtype=np.float64, block=BLOCK_ROWS, cache_dir=CACHE_DIR):
+    """
+    Sparse (aggregated) tables of one archive, stored in cache_dir/Sparse under the
+    digests of the archive and the aggregation workbook.
+    """
+    sources = [path] if aggregation is None else [path, aggregation]
+    entry = Path(cache_dir) / 'Sparse' / f'{cache_entry(sources, cache_dir).name} {np.dtype(dtype).name}'
+    if (entry / 'meta.json').exists():
+        return IOTables.load(entry)
+
+    tables = read_exiobase_zip(path, dtype, block)
+    if aggregation is not None:
+        tables = aggregate(tables, cached_aggregation(aggregation, tables, cache_dir=cache_dir))
+    tables.save(entry)
+    return tables
+
+
+#%% Indicators
+
+def indicators(tables, sectors=TITANIUM_SECTORS, accounts=ACCOUNTS):
+    """
+    Output x, value added v.x (all factors) and the satellite flows e.x of `accounts`
+    for the sectors selected by `sectors` (a label or pd.IndexSlice key).
+    """
+    unknown = [account for account in accounts if account not in tables.accounts]
+    if unknown:
+        raise KeyError(f"{unknown} are not satellite accounts of these tables "
+                       f"(the default ACCOUNTS exist only after aggregation)")
+    positions = tables.index[sectors]
+    V, E = tables.flow('V'), tables.flow('E')
+    columns = {
+        'output': tables.x[positions],
+        'value_added': np.asarray(V[:, positions].sum(axis=0)).ravel(),
+    }
+    for account in accounts:
+        columns[account] = E[tables.accounts.get_loc(account), positions].toarray().ravel()
+    return pd.DataFrame(columns, index=tables.index.labels(positions))
+
+
+def year_indicators(year, path, aggregation=None, sectors=TITANIUM_SECTORS, accounts=ACCOUNTS,
+                    dtype=np.float64, block=BLOCK_ROWS, cache_dir=CACHE_DIR):
+    """Indicators of one archive, indexed by (Year, Region, Level, Item)."""
+    tables = year_tables(path, aggregation, dtype, block, cache_dir)
+    return pd.concat({year: indicators(tables, sectors, accounts)}, names=['Year'])
+
+
+def panel(archives, aggregation=None, sectors=TITANIUM_SECTORS, accounts=ACCOUNTS,
+          max_workers=None, dtype=np.float64, block=BLOCK_ROWS, cache_dir=CACHE_DIR):
+    """
+    Stacked indicators for {year: archive}. Each year runs in its own worker process
+    (replaced after every year, so memory is returned); at most `max_workers` years
+    are in memory at once, each as sparse matrices plus one block of text. The
+    default ACCOUNTS need an `aggregation`.
+    """
+    if aggregation is None and tuple(accounts) == ACCOUNTS:
+        raise ValueError(f"accounts {list(ACCOUNTS)} exist only after aggregation; pass an aggregation "
+                         f"workbook or raw EXIOBASE stressor names as accounts")
+    if max_workers == 1:
+        frames = [year_indicators(year, path, aggregation, sectors, accounts, dtype, block, cache_dir)
+                  for year, path in archives.items()]
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers, max_tasks_per_child=1) as pool:
+            futures = [pool.submit(year_indicators, year, path, aggregation, sectors, accounts, dtype, block, cache_dir)
+                       for year, path in archives.items()]
+            frames = [future.result() for future in futures]
+    return pd.concat(frames).sort_index()
+
+
+#%% Titanium panel 1995-2022
+if __name__ == '__main__':
+    folder = Path(__file__).parent
+    archives = find_archives(folder, years=range(1995, 2023))
+    print(f"{len(archives)} archives: {', '.join(map(str, archives))}")
+
+    titanium = panel(archives, aggregation=folder / 'Aggregation module.xlsx', max_workers=2)
+    print(titanium.loc[pd.IndexSlice[:, 'EU27', :, :], :])
+    titanium.to_excel(folder / 'Titanium panel.xlsx')
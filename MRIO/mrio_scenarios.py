@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+IO scenarios as sparse changes to the baseline: coefficient deltas (z, v, e) and
+final demand deltas, evaluated on the factorized baseline by low-rank updates
+instead of re-parsing and re-solving an edited coefficient workbook. Sweeps over a
+scenario intensity (import substitution) are solved for all intensities at once.
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import scipy.sparse
+
+from mrio_leontief import LeontiefSystem, Factorization
+
+TITANIUM = ('EU27', 'Sector', 'Manufacturing of Titanium and articles thereof')
+EMPLOYMENT = 'Employment people'
+
+
+#%% Coefficient workbooks
+
+def read_coefficients_workbook(path):
+    """
+    Tables of a MARIO coefficients workbook (sheet 'coefficients', three header rows
+    and three index columns): z, v, e, the final demand Y and its satellite EY.
+    """
+    table = pd.read_excel(path, sheet_name='coefficients', header=[0, 1, 2], index_col=[0, 1, 2])
+    table.index.names = table.columns.names = ['Region', 'Level', 'Item']
+    level_rows = table.index.get_level_values('Level')
+    level_columns = table.columns.get_level_values('Level')
+    sector_rows, sector_columns = level_rows == 'Sector', level_columns == 'Sector'
+    demand_columns = level_columns == 'Consumption category'
+
+    def block(rows, columns, drop_region=False):
+        part = table.loc[rows, columns].astype(float)
+        return part.droplevel(['Region', 'Level']) if drop_region else part
+
+    return {
+        'z': block(sector_rows, sector_columns),
+        'v': block(level_rows == 'Factor of production', sector_columns, drop_region=True),
+        'e': block(level_rows == 'Satellite account', sector_columns, drop_region=True),
+        'Y': block(sector_rows, demand_columns),
+        'EY': block(level_rows == 'Satellite account', demand_columns, drop_region=True),
+    }
+
+
+#%% Deltas
+
+def sparse_delta(changes, index):
+    """Sparse (n x n) coefficient delta from {(row label, column label): change}."""
+    rows = index.get_indexer([row for row, _ in changes])
+    cols = index.get_indexer([col for _, col in changes])
+    if (rows < 0).any() or (cols < 0).any():
+        raise KeyError("coefficient changes refer to sectors not in the index")
+    return scipy.sparse.csc_matrix((list(changes.values()), (rows, cols)), shape=(len(index), len(index)))
+
+
+def coefficient_deltas(baseline, scenario, atol=1e-12):
+    """
+    Differences between two sets of tables on the same sectors: 'z' as a sparse
+    matrix, 'v', 'e' and 'Y' as tables (None when unchanged).
+    """
+    if not baseline['z'].index.equals(scenario['z'].index):
+        raise ValueError("scenario and baseline have different sectors; deltas need the same IO system")
+    deltas = {}
+    for name in ['z', 'v', 'e', 'Y']:
+        change = scenario[name].reindex_like(baseline[name]).fillna(0) - baseline[name]
+        change = change.where(change.abs() > atol, 0.0)
+        if name == 'z':
+            deltas[name] = scipy.sparse.csc_matrix(change.to_numpy())
+        else:
+            deltas[name] = change if change.to_numpy().any() else None
+    return deltas
+
+
+#%% Evaluation
+
+def indicators(system, demand, sector=TITANIUM, region='EU27', account=EMPLOYMENT):
+    """
+    Output, value added and employment of `sector` and of all sectors of `region`,
+    as computed in `Exiobase parsing.py` (value added summed over factors).
+    """
+    x = system.output(demand)
+    value_added = system.value_added(demand, x).sum()
+    employment = system.employment(demand, x, account).sum()
+    in_region = x.index.get_level_values('Region') == region
+    return pd.Series({
+        'output': x[sector],
+        'value_added': value_added[sector],
+        'employment': employment[sector],
+        'region_output': x[in_region].sum(),
+        'region_value_added': value_added[in_region].sum(),
+        'region_employment': employment[in_region].sum(),
+    })
+
+
+def evaluate_scenario(system, demand, deltas, **kwargs):
+    """
+    Indicators of the baseline and of the scenario given by `deltas` (see
+    coefficient_deltas), and their difference. The scenario reuses the baseline
+    factorization through a low-rank update.
+    """
+    v = system.v + deltas['v'] if deltas.get('v') is not None else None
+    e = system.e + deltas['e'] if deltas.get('e') is not None else None
+    shocked = system.shocked(deltas.get('z'), v, e)
+    scenario_demand = demand + deltas['Y'].sum(axis=1) if deltas.get('Y') is not None else demand
+    result = pd.DataFrame({
+        'baseline': indicators(system, demand, **kwargs),
+        'scenario': indicators(shocked, scenario_demand, **kwargs),
+    })
+    result['difference'] = result['scenario'] - result['baseline']
+    return result
+
+
+#%% Import-substitution sweep
+
+def import_substitution(system, Y, product=TITANIUM):
+    """
+    Full (100%) substitution of imports of `product` by domestic supply in the region
+    of `product`: for every sector and final demand category of that region, inputs
+    of the same item from other regions move to the domestic row. Returns the
+    coefficient delta (sparse) and the final demand delta (vector); intermediate
+    shares s scale both linearly.
+    """
+    index = system.index
+    region, item = product[0], product[-1]
+    regions, items = index.get_level_values(0), index.get_level_values(-1)
+    domestic = index.get_loc(product)
+    imported = np.flatnonzero((items == item) & (regions != region))
+    users = np.flatnonzero(regions == region)
+
+    A = system.A[imported][:, users]
+    A = A.toarray() if scipy.sparse.issparse(A) else A
+    rows = np.concatenate([imported, [domestic]])
+    changes = np.vstack([-A, A.sum(axis=0, keepdims=True)])
+    delta_A = scipy.sparse.csc_matrix((changes.ravel(), (np.repeat(rows, len(users)), np.tile(users, len(rows)))),
+                                      shape=(system.n_sectors, system.n_sectors))
+
+    demand = Y.loc[:, Y.columns.get_level_values(0) == region].sum(axis=1).to_numpy()
+    delta_y = np.zeros(system.n_sectors)
+    delta_y[imported] = -demand[imported]
+    delta_y[domestic] = demand[imported].sum()
+    return delta_A, delta_y
+
+
+def _sweep_indicators(system, X, product, account):
+    """Indicators (as in `indicators`) for output columns X (sectors x cases)."""
+    va = np.asarray(system.v.sum(axis=0)).ravel()[:, None] * X
+    e = system.e.loc[[account]] if isinstance(system.e, pd.DataFrame) else system.e
+    employment = np.asarray(e).ravel()[:, None] * X
+    sector = system.index.get_loc(product)
+    in_region = system.index.get_level_values(0) == product[0]
+    return {
+        'output': X[sector],
+        'value_added': va[sector],
+        'employment': employment[sector],
+        'region_output': X[in_region].sum(axis=0),
+        'region_value_added': va[in_region].sum(axis=0),
+        'region_employment': employment[in_region].sum(axis=0),
+    }
+
+
+def _woodbury_sweep(system, y, delta_A, delta_y, shares):
+    """
+    Outputs for A + s delta_A and y + s delta_y for all shares s at once. delta_A is
+    U D with U the unit columns of its non-zero rows, so M^-1 U is shared by every
+    share and only a batch of small (k x k) capacitance systems depends on s.
+    """
+    delta_A = scipy.sparse.csr_matrix(delta_A)
+    rows = np.unique(delta_A.nonzero()[0])
+    D = delta_A[rows].toarray()                                  # k x n
+    unit = np.zeros((system.n_sectors, len(rows)))
+    unit[rows, np.arange(len(rows))] = 1.0
+
+    solved = system.factors.solve(np.column_stack([y, delta_y, unit]))
+    base = solved[:, :1] + solved[:, 1:2] * shares               # M^-1 y(s), n x S
+    MU = solved[:, 2:]                                           # M^-1 U, n x k
+    G = D @ MU                                                   # k x k
+    capacitance = np.eye(len(rows)) - shares[:, None, None] * G  # S x k x k
+    rhs = shares[:, None] * (D @ base).T                         # S x k
+    correction = np.linalg.solve(capacitance, rhs[..., None])[..., 0]
+    return base + MU @ correction.T
+
+
+_worker = {}
+
+
+def _init_sweep_worker(A, delta_A, y, delta_y, sparse):
+    _worker.update(A=A, delta_A=delta_A, y=y, delta_y=delta_y, sparse=sparse)
+
+
+def _solve_share(share):
+    A = _worker['A'] + share * _worker['delta_A']
+    identity = scipy.sparse.identity(A.shape[0], format='csc') if scipy.sparse.issparse(A) else np.eye(A.shape[0])
+    return Factorization(identity - A, _worker['sparse']).solve(_worker['y'] + share * _worker['delta_y'])
+
+
+def substitution_sweep(system, Y, shares=None, product=TITANIUM, account=EMPLOYMENT, refactor=False,
+                       max_workers=None):
+    """
+    Output, value added and employment of `product` and of its region as a function
+    of the import-substitution share (default 0 to 100% in 1% steps). All shares are
+    solved together from the baseline factors; with `refactor` each share is
+    factorized separately instead, spread over a process pool.
+    """
+    shares = np.linspace(0, 1, 101) if shares is None else np.asarray(shares, dtype=float)
+    delta_A, delta_y = import_substitution(system, Y, product)
+    y = Y.sum(axis=1).to_numpy()
+
+    if refactor:
+        delta = delta_A if scipy.sparse.issparse(system.A) else delta_A.toarray()
+        with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_sweep_worker,
+                                 initargs=(system.A, delta, y, delta_y, system.factors.sparse)) as pool:
+            X = np.column_stack(list(pool.map(_solve_share, shares)))
+    else:
+        X = _woodbury_sweep(system, y, delta_A, delta_y, shares)
+
+    return pd.DataFrame(_sweep_indicators(system, X, product, account), index=pd.Index(shares, name='share'))
+
+
+#%% Example: the LTE workbook as a delta on the baseline workbook
+if __name__ == '__main__':
+    folder = Path(__file__).parent
+    baseline = read_coefficients_workbook(folder / 'Baseline scenario.xlsx')
+    lte = read_coefficients_workbook(folder / 'LTE scenario.xlsx')
+
+    system = LeontiefSystem(baseline['z'], baseline['v'], baseline['e'])
+    deltas = coefficient_deltas(baseline, lte)
+    print(f"{deltas['z'].nnz} coefficient changes")
+    print(evaluate_scenario(system, baseline['Y'].sum(axis=1), deltas).round(3))
+
+    # Response of titanium and EU27 value added and employment to import substitution
+    sweep = substitution_sweep(system, baseline['Y'])
+    print(sweep.iloc[::10].round(3))
@@ -0,0 +1,326 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Compact IO data model: Z, A, Y and the satellite matrices in sparse storage (CSR,
+A in CSC for the factorization), optionally float32, and integer-coded
+(region, level, item) indexes. Slices such as pd.IndexSlice['EU27', 'Sector', :]
+resolve to positions through the integer codes instead of MultiIndex scans.
+"""
+
+import json
+import os
+import shutil
+import tempfile
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import scipy.sparse
+
+from mrio_leontief import LeontiefSystem
+
+# Dense (or memory-mapped) tables are converted to sparse in blocks of this many rows
+BLOCK_ROWS = 1024
+
+_MATRICES = ['Z', 'A', 'Y', 'V', 'E', 'EY', 'v', 'e']
+
+
+#%% Index
+
+class SectorIndex:
+    """
+    Integer-coded index: one small integer code array per level (Region, Level,
+    Item) and, per level, the lookup table from code to label.
+    """
+
+    def __init__(self, levels, codes, names):
+        self.names = list(names)
+        self.levels = [pd.Index(level) for level in levels]
+        self.codes = [np.asarray(c, dtype=np.min_scalar_type(max(len(level) - 1, 0)))
+                      for c, level in zip(codes, self.levels)]
+        self._keys = None
+
+    @classmethod
+    def from_index(cls, index):
+        if not isinstance(index, pd.MultiIndex):
+            index = pd.MultiIndex.from_arrays([index], names=[index.name])
+        index = index.remove_unused_levels()
+        return cls(index.levels, index.codes, index.names)
+
+    def __len__(self):
+        return len(self.codes[0])
+
+    def lookup_table(self):
+        """Code -> label for every level, as one table (level, code, label)."""
+        return pd.concat([pd.DataFrame({'level': name, 'code': np.arange(len(level)), 'label': level})
+                          for name, level in zip(self.names, self.levels)], ignore_index=True)
+
+    def labels(self, positions=None):
+        """Labels as a pandas MultiIndex, for all rows or the given positions."""
+        codes = self.codes if positions is None else [c[positions] for c in self.codes]
+        return pd.MultiIndex(levels=self.levels, codes=codes, names=self.names)
+
+    def _code(self, level, label):
+        try:
+            return self.levels[level].get_loc(label)
+        except KeyError:
+            raise KeyError(f"{label!r} is not a {self.names[level]} of this index") from None
+
+    def _expand(self, key):
+        if not isinstance(key, tuple):
+            key = (key,)
+        if Ellipsis in key:
+            i = key.index(Ellipsis)
+            key = key[:i] + (slice(None),) * (len(self.names) - len(key) + 1) + key[i + 1:]
+        if len(key) > len(self.names):
+            raise KeyError(f"too many levels in {key!r} for index {self.names}")
+        return key + (slice(None),) * (len(self.names) - len(key))
+
+    def get_loc(self, key):
+        """Position of one full label, e.g. ('EU27', 'Sector', 'Manufacturing of ...')."""
+        if self._keys is None:
+            self._keys = {codes: i for i, codes in enumerate(zip(*(c.tolist() for c in self.codes)))}
+        key = self._expand(key)
+        position = self._keys.get(tuple(self._code(level, label) for level, label in enumerate(key)))
+        if position is None:
+            raise KeyError(key)
+        return position
+
+    def __getitem__(self, key):
+        """
+        Positions selected by a label, a list of labels or a full slice (:) per
+        level, e.g. index[pd.IndexSlice['EU27', 'Sector', ...]] or index['EU27'].
+        """
+        mask = np.ones(len(self), dtype=bool)
+        for level, labels in enumerate(self._expand(key)):
+            if isinstance(labels, slice):
+                if labels != slice(None):
+                    raise TypeError("only full slices (:) are supported; select labels by list instead")
+                continue
+            if isinstance(labels, (list, tuple, np.ndarray, pd.Index)):
+                mask &= np.isin(self.codes[level], [self._code(level, label) for label in labels])
+            else:
+                mask &= self.codes[level] == self._code(level, labels)
+        return np.flatnonzero(mask)
+
+    def meta(self):
+        return {'names': self.names, 'levels': [level.tolist() for level in self.levels],
+                'codes': [c.tolist() for c in self.codes]}
+
+    @classmethod
+    def from_meta(cls, meta):
+        return cls(meta['levels'], meta['codes'], meta['names'])
+
+
+def _positions(index, key):
+    """Positions of `key` in a SectorIndex or a plain pandas index (None: all)."""
+    if key is None:
+        return slice(None)
+    if isinstance(index, SectorIndex):
+        return index[key]
+    if isinstance(key, (list, tuple, np.ndarray, pd.Index)):
+        positions = index.get_indexer(key)
+        if (positions < 0).any():
+            raise KeyError(f"unknown labels: {[k for k, p in zip(key, positions) if p < 0]}")
+        return positions
+    return [index.get_loc(key)]
+
+
+#%% Conversion
+
+def _sparse(table, dtype, block=BLOCK_ROWS):
+    """CSR matrix of a DataFrame, array or memmap, converted `block` rows at a time."""
+    if scipy.sparse.issparse(table):
+        return scipy.sparse.csr_matrix(table, dtype=dtype)
+    values = table.to_numpy() if isinstance(table, pd.DataFrame) else np.asarray(table)
+    if values.ndim == 1:
+        values = values[:, None]
+    blocks = [scipy.sparse.csr_matrix(np.asarray(values[i:i + block], dtype=dtype))
+              for i in range(0, values.shape[0], block)]
+    return scipy.sparse.vstack(blocks, format='csr') if blocks else scipy.sparse.csr_matrix(values.shape, dtype=dtype)
+
+
+def _reciprocal(x):
+    return np.divide(1, x, out=np.zeros_like(x), where=x != 0)
+
+
+#%% Tables
+
+class IOTables:
+    """
+    IO tables on integer-coded indexes: `index` (sectors), `demand` (final demand
+    categories), `factors` and `accounts` (pandas indexes of V and E). Matrices are
+    sparse: Z, Y, V, E, EY, v, e in CSR, A in CSC; x is a dense vector.
+    """
+
+    def __init__(self, index, x, demand=None, factors=None, accounts=None, units=None, **matrices):
+        self.index, self.demand = index, demand
+        self.factors, self.accounts = factors, accounts
+        self.x = x
+        self.units = units
+        for name in _MATRICES:
+            setattr(self, name, matrices.get(name))
+
+    @classmethod
+    def from_tables(cls, tables, dtype=np.float64, block=BLOCK_ROWS):
+        """
+        Sparse tables from MARIO-style DataFrames (Z, Y, V, E, EY, X and/or z, v, e,
+        e.g. from mrio_cache). Dense or memory-mapped values are converted block by
+        block, so only the non-zeros of each table are held in memory. Missing
+        coefficients are derived from the flows and X.
+        """
+        reference = tables['z'] if 'z' in tables else tables['Z']
+        sectors = reference.index
+        if 'X' in tables:
+            x = np.asarray(tables['X'].to_numpy(), dtype=dtype).ravel()
+        else:
+            x = None
+        scale = None if x is None else scipy.sparse.diags(_reciprocal(x))
+
+        def matrix(flow, coefficient=None):
+            if coefficient in tables:
+                return _sparse(tables[coefficient], dtype, block)
+            if flow in tables and scale is not None and coefficient is not None:
+                return (_sparse(tables[flow], dtype, block) @ scale).tocsr()
+            return _sparse(tables[flow], dtype, block) if flow in tables else None
+
+        matrices = {
+            'Z': matrix('Z'), 'Y': matrix('Y'), 'V': matrix('V'), 'E': matrix('E'), 'EY': matrix('EY'),
+            'A': matrix('Z', 'z'), 'v': matrix('V', 'v'), 'e': matrix('E', 'e'),
+        }
+        if matrices['A'] is None:
+            raise KeyError("tables need the coefficients z or the flows Z with the output X")
+        matrices['A'] = matrices['A'].tocsc()
+
+        def rows_of(*names):
+            return next((tables[name].index for name in names if name in tables), None)
+
+        return cls(
+            index=SectorIndex.from_index(sectors),
+            x=x,
+            demand=SectorIndex.from_index(tables['Y'].columns) if 'Y' in tables else None,
+            factors=rows_of('v', 'V'),
+            accounts=rows_of('e', 'E'),
+            units=tables.get('units'),
+            **matrices,
+        )
+
+    @classmethod
+    def from_flows(cls, index, x, Z, Y=None, V=None, E=None, EY=None, **axes):
+        """Tables from sparse flows and output x; the coefficients A, v and e are derived."""
+        scale = scipy.sparse.diags(_reciprocal(x))
+
+        def coefficients(flow):
+            return None if flow is None else (flow @ scale).tocsr()
+
+        return cls(index, x, Z=Z, Y=Y, V=V, E=E, EY=EY, A=coefficients(Z).tocsc(), v=coefficients(V),
+                   e=coefficients(E), **axes)
+
+    def flow(self, name):
+        """Flow matrix Z, V or E; from its coefficients and x when only those are stored."""
+        if getattr(self, name) is not None:
+            return getattr(self, name)
+        coefficients = getattr(self, {'Z': 'A', 'V': 'v', 'E': 'e'}[name])
+        if coefficients is None or self.x is None:
+            return None
+        return (coefficients @ scipy.sparse.diags(self.x)).tocsr()
+
+    @property
+    def nbytes(self):
+        """Memory held by the values of all stored matrices."""
+        total = 0 if self.x is None else self.x.nbytes
+        for name in _MATRICES:
+            matrix = getattr(self, name)
+            if matrix is not None:
+                total += matrix.data.nbytes + matrix.indices.nbytes + matrix.indptr.nbytes
+        return total
+
+    # === Selection ===
+
+    def _axes(self, name):
+        sectors = self.index
+        return {
+            'Z': (sectors, sectors), 'A': (sectors, sectors), 'Y': (sectors, self.demand),
+            'V': (self.factors, sectors), 'v': (self.factors, sectors),
+            'E': (self.accounts, sectors), 'e': (self.accounts, sectors),
+            'EY': (self.accounts, self.demand),
+        }[name]
+
+    def select(self, name, rows=None, columns=None):
+        """
+        Block of matrix `name` ('Z', 'A', 'Y', 'V', 'v', 'E', 'e', 'EY', or 'x'),
+        rows and columns given as labels or pd.IndexSlice keys (None: all).
+        """
+        if name == 'x':
+            return self.x[_positions(self.index, rows)]
+        row_index, column_index = self._axes(name)
+        matrix = getattr(self, name)
+        return matrix[_positions(row_index, rows)][:, _positions(column_index, columns)]
+
+    # === Models and exports ===
+
+    def leontief(self, sparse=None):
+        """
+        LeontiefSystem on these coefficients. The factorization and the solves run
+        in float64 also when the tables are stored as float32.
+        """
+        labels = self.index.labels()
+        v = None if self.v is None else pd.DataFrame(self.v.toarray(), index=self.factors, columns=labels)
+        e = None if self.e is None else pd.DataFrame.sparse.from_spmatrix(self.e, index=self.accounts, columns=labels)
+        return LeontiefSystem(self.A.astype(np.float64), v, e, index=labels, sparse=sparse)
+
+    def to_tables(self, names=None):
+        """Dense DataFrames (as MARIO would hold them), e.g. for Excel exports."""
+        tables = {}
+        if self.x is not None and (names is None or 'X' in names):
+            tables['X'] = pd.DataFrame(self.x, index=self.index.labels(), columns=['production'])
+        for name in _MATRICES:
+            matrix = getattr(self, name)
+            if matrix is None or (names is not None and name not in names):
+                continue
+            rows, columns = (axis.labels() if isinstance(axis, SectorIndex) else axis for axis in self._axes(name))
+            tables['z' if name == 'A' else name] = pd.DataFrame(matrix.toarray(), index=rows, columns=columns)
+        return tables
+
+    # === Files ===
+
+    def save(self, folder):
+        """Write the matrices as .npz and the indexes as meta.json; the folder is replaced atomically."""
+        folder = Path(folder)
+        folder.parent.mkdir(parents=True, exist_ok=True)
+        tmp = Path(tempfile.mkdtemp(dir=folder.parent, prefix='.tmp '))
+        meta = {'index': self.index.meta(), 'matrices': []}
+        if self.demand is not None:
+            meta['demand'] = self.demand.meta()
+        for name, index in [('factors', self.factors), ('accounts', self.accounts)]:
+            if index is not None:
+                meta[name] = index.tolist()
+        if self.x is not None:
+            np.save(tmp / 'x.npy', self.x)
+        for name in _MATRICES:
+            if getattr(self, name) is not None:
+                scipy.sparse.save_npz(tmp / f'{name}.npz', getattr(self, name))
+                meta['matrices'].append(name)
+        (tmp / 'meta.json').write_text(json.dumps(meta))
+
+        if folder.exists():
+            shutil.rmtree(folder)
+        os.replace(tmp, folder)
+        return folder
+
+    @classmethod
+    def load(cls, folder):
+        folder = Path(folder)
+        meta = json.loads((folder / 'meta.json').read_text())
+        x = np.load(folder / 'x.npy') if (folder / 'x.npy').exists() else None
+        matrices = {name: scipy.sparse.load_npz(folder / f'{name}.npz') for name in meta['matrices']}
+        if 'A' in matrices:
+            matrices['A'] = matrices['A'].tocsc()
+        return cls(
+            index=SectorIndex.from_meta(meta['index']),
+            x=x,
+            demand=SectorIndex.from_meta(meta['demand']) if 'demand' in meta else None,
+            factors=pd.Index(meta['factors']) if 'factors' in meta else None,
+            accounts=pd.Index(meta['accounts']) if 'accounts' in meta else None,
+            **matrices,
+        )
@@ -10,87 +10,94 @@ import pandas as pd
 import matplotlib.pyplot as plt
 from pathlib import Path
 
-#%% 1. Read the comparison sheet
-comparison_path = Path(__file__).parent /'Comparison.xlsx'
-df = pd.read_excel(comparison_path, sheet_name='planes', index_col=0)
-
-# 2. Plot inflows
-plt.figure(figsize=(10, 5))
-plt.plot(df.index, df['inflow_LTE'],      label='LTE', color='r')
-plt.plot(df.index, df['inflow_baseline'], label='Baseline', color='b')
-plt.title('Annual Plane Inflow: Baseline vs. LTE')
-plt.xlabel('Year')
-plt.ylabel('Number of Planes')
-plt.legend()
-plt.grid(False)
-plt.savefig(Path(__file__).parent /'Inflows comparison.png', dpi=300)
-plt.close()
+from dmfa_model import BASELINE, LTE, load_inputs, run_scenario
+from dmfa_compare import compare_scenarios
 
-# 3. Plot outflows
-plt.figure(figsize=(10, 5))
-plt.plot(df.index, df['outflow_LTE'],      label='LTE', color='r')
-plt.plot(df.index, df['outflow_baseline'], label='Baseline', color='b')
-plt.title('Annual Plane Outflow: Baseline vs. LTE')
-plt.xlabel('Year')
-plt.ylabel('Number of Planes')
-plt.legend()
-plt.savefig(Path(__file__).parent /'Outflows comparison.png', dpi=300)
-plt.close()
+#%% 1. Run the scenarios to compare (any number; the first one is the reference)
+scenarios = [BASELINE, LTE]
+reference = scenarios[0]['name']
+comparison_years = (2024, 2060)
 
-#%% 1. Read the comparison sheet
-comparison_path = Path(__file__).parent /'Comparison.xlsx'
-titanium = pd.read_excel(comparison_path, sheet_name='titanium', index_col=0)
-
-kt_inflow_baseline = titanium['inflow_baseline'] / 1_000
-kt_inflow_LTE      = titanium['inflow_LTE']      / 1_000
-
-kt_outflow_baseline = titanium['outflow_baseline'] / 1_000
-kt_outflow_LTE      = titanium['outflow_LTE']      / 1_000
-
-# 2. Plot inflows
-plt.figure(figsize=(10, 5))
-plt.plot(titanium.index, kt_inflow_baseline, label='Baseline', color='b')
-plt.plot(titanium.index, kt_inflow_LTE,      label='LTE', color='r')
-plt.title('Annual Titanium Inflow: Baseline vs. LTE')
-plt.xlabel('Year')
-plt.ylabel('Titanium metal (kt)')
-plt.legend()
-plt.grid(False)
-plt.savefig(Path(__file__).parent / 'Titanium Inflows comparison.png', dpi=300)
-plt.close()
+colors = {'Baseline': 'b', 'LTE': 'r'}
+
+inputs = load_inputs()
+results = {scenario['name']: run_scenario(scenario, inputs, vintage_matrices=False) for scenario in scenarios}
+
+#%% 2. Deltas, cumulative differences and peak divergence year
+variables = [
+    ('planes_projection', 'inflow'),
+    ('planes_projection', 'outflow'),
+    ('titanium_projection', 'inflow'),
+    ('titanium_projection', 'outflow'),
+]
+comparisons = compare_scenarios(results, reference, variables, comparison_years)
+
+summary = pd.concat({f'{table} {column}': c['summary'] for (table, column), c in comparisons.items()})
+print(summary)
+
+names = list(results)
+title_vs = ' vs. '.join(names)
+
+
+def plot_scenarios(ax, values, scale=1):
+    # Reference on top, other scenarios slightly transparent underneath
+    for name in names:
+        is_reference = name == reference
+        ax.plot(values.index, values[name] / scale, label=name, color=colors.get(name),
+                alpha=1 if is_reference else 0.8, zorder=2 if is_reference else 1)
+    ax.legend()
+    ax.grid(False)
 
-# 3. Plot outflows
-plt.figure(figsize=(10, 5))
-plt.plot(titanium.index, kt_outflow_baseline, label='Baseline', color='b')
-plt.plot(titanium.index, kt_outflow_LTE ,      label='LTE', color='r')
-plt.title('Annual Titanium Outflow: Baseline vs. LTE')
-plt.xlabel('Year')
-plt.ylabel('Titanium metal (kt)')
-plt.legend()
-plt.savefig(Path(__file__).parent /'Titanium Outflows comparison.png', dpi=300)
-plt.close()
 
-#%%
+#%% 3. Plane inflows and outflows
+for column, file_name in [('inflow', 'Inflows comparison.png'), ('outflow', 'Outflows comparison.png')]:
+    fig, ax = plt.subplots(figsize=(10, 5))
+    plot_scenarios(ax, comparisons[('planes_projection', column)]['values'])
+    ax.set_title(f'Annual Plane {column.capitalize()}: {title_vs}')
+    ax.set_xlabel('Year')
+    ax.set_ylabel('Number of Planes')
+    fig.savefig(Path(__file__).parent / file_name, dpi=300)
+    plt.close(fig)
+
+#%% 4. Titanium inflows and outflows (kt)
+for column, file_name in [('inflow', 'Titanium Inflows comparison.png'), ('outflow', 'Titanium Outflows comparison.png')]:
+    fig, ax = plt.subplots(figsize=(10, 5))
+    plot_scenarios(ax, comparisons[('titanium_projection', column)]['values'], scale=1_000)
+    ax.set_title(f'Annual Titanium {column.capitalize()}: {title_vs}')
+    ax.set_xlabel('Year')
+    ax.set_ylabel('Titanium metal (kt)')
+    fig.savefig(Path(__file__).parent / file_name, dpi=300)
+    plt.close(fig)
+
+#%% 5. Combined titanium figure
 fig, axes = plt.subplots(2, 1, figsize=(10, 10), sharex=False)
+for ax, column in zip(axes, ['inflow', 'outflow']):
+    plot_scenarios(ax, comparisons[('titanium_projection', column)]['values'], scale=1_000)
+    ax.set_title(f'Annual Titanium {column.capitalize()}: {title_vs}')
+    ax.set_xlabel('Year')
+    ax.set_ylabel('Titanium metal (kt)')
 
-# --- 1. Inflows ---
-axes[0].plot(titanium.index, kt_inflow_baseline, label='Baseline', color='b', alpha=1, zorder=2)
-axes[0].plot(titanium.index, kt_inflow_LTE, label='LTE', color='r', alpha=0.8, zorder=1)
-axes[0].set_title('Annual Titanium Inflow: Baseline vs. LTE')
+plt.tight_layout()
+plt.savefig(Path(__file__).parent / 'Titanium_Flows_Comparison.png', dpi=300)
+plt.close()
+
+#%% 6. Differences to the reference scenario (titanium outflow, kt)
+delta = comparisons[('titanium_projection', 'outflow')]['delta'].drop(columns=reference) / 1_000
+cumulative = comparisons[('titanium_projection', 'outflow')]['cumulative'].drop(columns=reference) / 1_000
+
+fig, axes = plt.subplots(2, 1, figsize=(10, 10), sharex=False)
+delta.plot(ax=axes[0], color=[colors.get(name) for name in delta.columns])
+axes[0].axhline(0, color='k', linewidth=0.8)
+axes[0].set_title(f'Annual Titanium Outflow: difference to {reference}')
 axes[0].set_ylabel('Titanium metal (kt)')
-axes[0].set_xlabel('Year')
-axes[0].legend()
-axes[0].grid(False)
-
-# --- 2. Outflows ---
-axes[1].plot(titanium.index, kt_outflow_baseline, label='Baseline', color='b', alpha=1, zorder=2)
-axes[1].plot(titanium.index, kt_outflow_LTE, label='LTE', color='r', alpha=0.8, zorder=1)
-axes[1].set_title('Annual Titanium Outflow: Baseline vs. LTE')
-axes[1].set_xlabel('Year')
+cumulative.plot(ax=axes[1], color=[colors.get(name) for name in cumulative.columns])
+axes[1].axhline(0, color='k', linewidth=0.8)
+axes[1].set_title(f'Cumulative Titanium Outflow: difference to {reference}')
 axes[1].set_ylabel('Titanium metal (kt)')
-axes[1].legend()
-axes[1].grid(False)
+for ax in axes:
+    ax.set_xlabel('Year')
+    ax.grid(False)
 
 plt.tight_layout()
-plt.savefig(Path(__file__).parent / 'Titanium_Flows_Comparison.png', dpi=300)
+plt.savefig(Path(__file__).parent / 'Titanium_Outflow_Differences.png', dpi=300)
 plt.close()
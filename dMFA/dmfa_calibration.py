@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Calibration of the survival curve (and optionally the backcast curve) against the
+observed fleet stock and, when available, retirement and delivery data.
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+import scipy.linalg
+import scipy.optimize
+import scipy.signal
+import scipy.stats
+
+from dmfa_model import BASELINE, load_inputs, project_stock, solve_inflow_batch, convolve_cohorts
+
+# Parameters that can be fitted, with their bounds
+PARAMETER_BOUNDS = {
+    'curve_surv_mean': (5, 60),
+    'curve_surv_sd': (1, 30),
+    'curve_mean': (1960, 2000),
+    'curve_sd': (2, 30),
+}
+
+
+#%% Residuals and their analytic Jacobians
+
+def _scaled_cdf(years, first_year, mean, sd):
+    """
+    Normal CDF Phi((years - mean) / sd) scaled to 1 at `first_year` (the backcast of
+    project_stock) and its derivatives by (mean, sd) on a new last axis.
+    """
+    z = (years - mean) / sd
+    z0 = (first_year - mean) / sd
+    cdf, cdf0 = scipy.stats.norm.cdf(z), scipy.stats.norm.cdf(z0)
+    pdf, pdf0 = scipy.stats.norm.pdf(z), scipy.stats.norm.pdf(z0)
+
+    # d/dmu Phi(z) = -phi(z) / sd, d/dsd Phi(z) = -phi(z) * z / sd
+    d_mean = (-pdf * cdf0 + cdf * pdf0) / (sd * cdf0 ** 2)
+    d_sd = (-pdf * z * cdf0 + cdf * pdf0 * z0) / (sd * cdf0 ** 2)
+    return cdf / cdf0, np.stack([d_mean, d_sd], axis=-1)
+
+
+def _scaled_sf(n_years, mean, sd):
+    """Survival curve Q(a) / Q(0) over ages 0..n_years-1 (survival_curve) and its derivatives by (mean, sd)."""
+    z = (np.arange(n_years) - mean) / sd
+    z0 = -mean / sd
+    sf, sf0 = scipy.stats.norm.sf(z), scipy.stats.norm.sf(z0)
+    pdf, pdf0 = scipy.stats.norm.pdf(z), scipy.stats.norm.pdf(z0)
+
+    # d/dmu Q(z) = phi(z) / sd, d/dsd Q(z) = phi(z) * z / sd
+    d_mean = (pdf * sf0 - sf * pdf0) / (sd * sf0 ** 2)
+    d_sd = (pdf * z * sf0 - sf * pdf0 * z0) / (sd * sf0 ** 2)
+    return sf / sf0, np.stack([d_mean, d_sd], axis=-1)
+
+
+def backcast_residuals(curve_mean, curve_sd, observed):
+    """
+    Relative misfit of the backcast normal CDF, scaled to the first observed year,
+    against the observed stock (vectorized over parameter sets). Returns residuals
+    and their analytic Jacobian with respect to (curve_mean, curve_sd); shapes
+    (sets, years) and (sets, years, 2).
+    """
+    curve_mean = np.asarray(curve_mean, dtype=float)[..., None]
+    curve_sd = np.asarray(curve_sd, dtype=float)[..., None]
+    years = observed.index.to_numpy(dtype=float)
+    stock = observed.to_numpy(dtype=float)
+
+    scaled, derivatives = _scaled_cdf(years, years[0], curve_mean, curve_sd)
+    residuals = (scaled * stock[0] - stock) / stock
+    return residuals, derivatives * (stock[0] / stock)[:, None]
+
+
+def _relative(model, data, years, derivative=False):
+    """Misfit of `model` (last axis: years) relative to `data`, or of its derivative (scaling only)."""
+    index = np.searchsorted(years, data.index)
+    values = data.to_numpy(dtype=float)
+    return (model[..., index] - (0.0 if derivative else values)) / np.maximum(np.abs(values), 1.0)
+
+
+def stock_residuals(x, names, observed, scenario=BASELINE, retirements=None, deliveries=None):
+    """
+    Relative misfit of the stock-driven model for one parameter set `x` (values of
+    `names`, see PARAMETER_BOUNDS): modelled stock (survivors + clipped inflow) against
+    the observed stock, plus outflow against retirements and inflow against deliveries
+    when given (Series by year). Returns the residuals and their analytic Jacobian,
+    shapes (residuals,) and (residuals, parameters).
+
+    The stock-driven solve is the lower-triangular system inflow[t] = stock[t] -
+    sum_{v<t} curve[t - v] * inflow[v] on the years where inflow is not clipped. Its
+    tangents solve the same system (unit diagonal, rows of clipped years zeroed) with
+    the derivatives of the stock target (backcast normal CDF) minus those of the
+    survivors through the curve (normal survival function) on the right-hand side.
+    """
+    value = dict(zip(names, np.asarray(x, dtype=float)))
+    last_year = max(series.index[-1] for series in (observed, retirements, deliveries) if series is not None)
+    years = np.arange(scenario['start_year'], last_year + 1)
+    n_years = len(years)
+    backcast = {name: value.get(name, scenario[name]) for name in ['curve_mean', 'curve_sd']}
+    surv_mean = value.get('curve_surv_mean', scenario['survival'][0][1])
+    surv_sd = value.get('curve_surv_sd', scenario['survival'][0][2])
+
+    stock = project_stock(years, observed, scenario['stock_target'], scenario['curve_mean_forecast'],
+                          scenario['curve_sd_forecast'], backcast['curve_mean'], backcast['curve_sd'])
+    curve, curve_derivatives = _scaled_sf(n_years, surv_mean, surv_sd)
+    inflow = solve_inflow_batch(stock[None], curve[None])[0][0]
+
+    # Modelled stock exceeds the target whenever survivors alone exceed it (inflow clipped to 0)
+    model_stock = convolve_cohorts(inflow, curve)
+    model_outflow = np.concatenate(([0.0], model_stock[:-1])) + inflow - model_stock
+
+    # === Tangents of the stock target and the curve, one column per parameter ===
+    before = years < observed.index[0]
+    _, stock_derivatives = _scaled_cdf(years[before], observed.index[0], backcast['curve_mean'], backcast['curve_sd'])
+    d_stock, d_curve = np.zeros((n_years, len(names))), np.zeros((n_years, len(names)))
+    for k, name in enumerate(names):
+        if name in ('curve_surv_mean', 'curve_surv_sd'):
+            d_curve[:, k] = curve_derivatives[:, ['curve_surv_mean', 'curve_surv_sd'].index(name)]
+        else:
+            d_stock[before, k] = stock_derivatives[:, ['curve_mean', 'curve_sd'].index(name)] * observed.iloc[0]
+
+    # === Triangular solve (d curve[0] = 0: the cohort of the year itself adds no term) ===
+    cohorts = scipy.linalg.toeplitz(curve, np.zeros(n_years))  # cohorts[t, v] = curve[t - v]
+    d_survivors = scipy.signal.fftconvolve(inflow[:, None], d_curve, axes=0)[:n_years]
+    active = (inflow > 0)[:, None]
+    d_inflow = scipy.linalg.solve_triangular(np.eye(n_years) + active * np.tril(cohorts, -1),
+                                             active * (d_stock - d_survivors), lower=True, unit_diagonal=True)
+    d_model_stock = d_survivors + cohorts @ d_inflow
+    d_model_outflow = np.vstack((np.zeros((1, len(names))), d_model_stock[:-1])) + d_inflow - d_model_stock
+
+    residuals, jacobian = [_relative(model_stock, observed, years)], [_relative(d_model_stock.T, observed, years, True)]
+    if retirements is not None:
+        residuals.append(_relative(model_outflow, retirements, years))
+        jacobian.append(_relative(d_model_outflow.T, retirements, years, True))
+    if deliveries is not None:
+        residuals.append(_relative(inflow, deliveries, years))
+        jacobian.append(_relative(d_inflow.T, deliveries, years, True))
+    return np.concatenate(residuals), np.concatenate(jacobian, axis=1).T
+
+
+#%% Calibration
+
+def _objective(x, names, observed, scenario, retirements, deliveries, fit_backcast):
+    """Sum of squared residuals and its analytic gradient (see stock_residuals)."""
+    residuals, jacobian = stock_residuals(x, names, observed, scenario, retirements, deliveries)
+    value = (residuals ** 2).sum()
+    gradient = 2 * residuals @ jacobian
+
+    if fit_backcast:
+        i, j = names.index('curve_mean'), names.index('curve_sd')
+        res, jac = backcast_residuals(x[i], x[j], observed)
+        value += (res ** 2).sum()
+        gradient[[i, j]] += 2 * np.einsum('y,yk->k', res, jac)
+    return value, gradient
+
+
+def _fit_one(x0, names, observed, scenario, retirements, deliveries, fit_backcast):
+    bounds = [PARAMETER_BOUNDS[name] for name in names]
+    return scipy.optimize.minimize(_objective, x0, jac=True, method='L-BFGS-B', bounds=bounds,
+                                   args=(names, observed, scenario, retirements, deliveries, fit_backcast))
+
+
+def calibrate(observed=None, retirements=None, deliveries=None, fit_backcast=False, scenario=BASELINE,
+              n_starts=1, seed=None, max_workers=1):
+    """
+    Fit the survival mean and sd (and with `fit_backcast` the backcast curve_mean and
+    curve_sd) by L-BFGS-B. Starts are the scenario values plus n_starts - 1 random
+    points within PARAMETER_BOUNDS, run in a process pool when max_workers > 1.
+    Returns the best parameters (Series) and a table of all starts.
+
+    The stock alone constrains the survival curve only where inflows are clipped at
+    zero; retirement or delivery data are needed to pin it down.
+    """
+    scenario = {**BASELINE, **scenario}
+    observed = load_inputs()['stock'] if observed is None else observed
+    names = ['curve_surv_mean', 'curve_surv_sd'] + (['curve_mean', 'curve_sd'] if fit_backcast else [])
+
+    _, surv_mean, surv_sd = scenario['survival'][0]
+    x0 = np.array([surv_mean, surv_sd, scenario['curve_mean'], scenario['curve_sd']][:len(names)], dtype=float)
+    low, high = np.array([PARAMETER_BOUNDS[name] for name in names]).T
+    rng = np.random.default_rng(seed)
+    starts = np.vstack([x0, rng.uniform(low, high, size=(n_starts - 1, len(names)))])
+
+    args = (names, observed, scenario, retirements, deliveries, fit_backcast)
+    if max_workers > 1 and n_starts > 1:
+        with ProcessPoolExecutor(max_workers=max_workers) as pool:
+            fits = list(pool.map(_fit_one, starts, *[[arg] * n_starts for arg in args]))
+    else:
+        fits = [_fit_one(start, *args) for start in starts]
+
+    runs = pd.DataFrame([dict(zip(names, fit.x), objective=fit.fun, success=fit.success) for fit in fits])
+    best = runs.loc[runs['objective'].idxmin(), names].astype(float)
+    return best, runs
+
+
+#%% Example
+if __name__ == '__main__':
+    import time
+    start = time.perf_counter()
+    best, runs = calibrate(fit_backcast=True, n_starts=8, seed=0)
+    print(runs.round(3))
+    print(best.round(2), f'\n{time.perf_counter() - start:.2f} s')
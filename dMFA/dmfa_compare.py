@@ -0,0 +1,42 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Comparison of any number of dMFA scenarios against a reference scenario.
+"""
+
+import pandas as pd
+
+
+def stack_variable(results_by_scenario, table, column):
+    """One column of one result table for every scenario: years x scenarios."""
+    return pd.DataFrame({name: results[table][column] for name, results in results_by_scenario.items()})
+
+
+def compare(values, reference):
+    """
+    Differences of every scenario (column) to the `reference` column: yearly delta,
+    cumulative delta and the year of largest absolute divergence.
+    """
+    delta = values.sub(values[reference], axis=0)
+    cumulative = delta.cumsum()
+    abs_delta = delta.abs()
+    summary = pd.DataFrame({
+        'peak_divergence_year': abs_delta.idxmax(),
+        'peak_divergence': delta.to_numpy()[abs_delta.to_numpy().argmax(axis=0), range(delta.shape[1])],
+        'cumulative_difference': cumulative.iloc[-1],
+    })
+    return {'values': values, 'delta': delta, 'cumulative': cumulative, 'summary': summary}
+
+
+def compare_scenarios(results_by_scenario, reference, variables, years=None):
+    """
+    `compare` for several (table, column) variables, optionally restricted to a
+    (first, last) year range. Returns {(table, column): comparison}.
+    """
+    comparisons = {}
+    for table, column in variables:
+        values = stack_variable(results_by_scenario, table, column)
+        if years is not None:
+            values = values.loc[years[0]:years[1]]
+        comparisons[(table, column)] = compare(values, reference)
+    return comparisons
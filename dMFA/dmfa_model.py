@@ -0,0 +1,735 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Reusable building blocks of the stock-driven dMFA fleet model.
+"""
+
+import hashlib
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import NamedTuple
+
+import numpy as np
+import pandas as pd
+import scipy.linalg
+import scipy.signal
+import scipy.stats
+
+from dmfa_survival import regime_curve
+from pipeline_profile import profiled, reset as reset_profile, take as take_profile, merge as merge_profile
+
+INPUT_PATH = Path(__file__).parent / 'Stock input data.xlsx'
+CACHE_DIR = Path(__file__).parent / 'Cache'
+
+# === Scenario definitions ===
+# 'survival' lists (first vintage year, mean, sd) normal regimes, or (first vintage
+# year, distribution, params) for any curve in dmfa_survival; a vintage uses the last
+# regime starting at or before it. 'stock_by_class' overrides the class shares.
+# 'steps_per_year' sets the time resolution (1 annual, 4 quarterly, 12 monthly).
+BASELINE = {
+    'name': 'Baseline',
+    'start_year': 1970,
+    'end_year': 2060,
+    'survival': [(1970, 25, 12.5)],
+    'stock_target': 8000,
+    'curve_mean_forecast': 2040,
+    'curve_sd_forecast': 10,
+    'curve_mean': 1985,
+    'curve_sd': 10,
+    'stock_by_class': None,
+    'steps_per_year': 1,
+}
+
+LTE = {
+    **BASELINE,
+    'name': 'LTE',
+    'survival': [(1970, 25, 12.5), (2030, 35, 12.5)],
+}
+
+STOCK_PARAMETERS = ['stock_target', 'curve_mean_forecast', 'curve_sd_forecast', 'curve_mean', 'curve_sd']
+
+
+class StockDrivenResult(NamedTuple):
+    inflow: np.ndarray
+    outflow: np.ndarray
+    nas: np.ndarray
+    cohort: np.ndarray
+
+
+class InflowDrivenResult(NamedTuple):
+    stock: np.ndarray
+    outflow: np.ndarray
+    nas: np.ndarray
+    cohort: np.ndarray
+
+
+#%% Inputs
+
+@profiled
+def load_inputs(path=INPUT_PATH, cache=True):
+    """
+    Inputs of the stock workbook (see read_inputs). With `cache`, the cleaned tables
+    are stored once as an NPZ file in CACHE_DIR, keyed by the workbook content hash,
+    and reused until the workbook changes.
+    """
+    if not cache:
+        return read_inputs(path)
+
+    path = Path(path)
+    digest = hashlib.sha256(path.read_bytes()).hexdigest()[:16]
+    cache_file = CACHE_DIR / f'{path.stem} - {digest}.npz'
+    if cache_file.exists():
+        return _read_input_cache(cache_file)
+
+    inputs = read_inputs(path)
+    CACHE_DIR.mkdir(exist_ok=True)
+    _write_input_cache(inputs, cache_file)
+    # Stale caches of earlier workbook versions; another process may be removing them too
+    for old in CACHE_DIR.glob(f'{path.stem} - *.npz'):
+        if old != cache_file:
+            old.unlink(missing_ok=True)
+    return inputs
+
+
+def _write_input_cache(inputs, cache_file):
+    arrays = {}
+    for name, table in inputs.items():
+        arrays[f'{name}/values'] = table.to_numpy(dtype=float)
+        arrays[f'{name}/index'] = table.index.to_numpy()
+        arrays[f'{name}/index_name'] = np.array(table.index.name or '', dtype=str)
+        if isinstance(table, pd.DataFrame):
+            arrays[f'{name}/columns'] = table.columns.to_numpy(dtype=str)
+        else:
+            arrays[f'{name}/name'] = np.array(table.name, dtype=str)
+    arrays = {key: value.astype(str) if value.dtype == object else value for key, value in arrays.items()}
+
+    # Write to a temporary file first so a parallel run never reads a partial cache
+    fd, tmp = tempfile.mkstemp(suffix='.npz', dir=cache_file.parent)
+    with os.fdopen(fd, 'wb') as f:
+        np.savez(f, **arrays)
+    os.replace(tmp, cache_file)
+
+
+def _read_input_cache(cache_file):
+    inputs = {}
+    with np.load(cache_file) as arrays:
+        names = dict.fromkeys(key.split('/')[0] for key in arrays.files)
+        for name in names:
+            values = arrays[f'{name}/values']
+            index = pd.Index(arrays[f'{name}/index'], name=str(arrays[f'{name}/index_name']) or None)
+            if f'{name}/columns' in arrays.files:
+                inputs[name] = pd.DataFrame(values, index=index, columns=arrays[f'{name}/columns'])
+            else:
+                inputs[name] = pd.Series(values, index=index, name=str(arrays[f'{name}/name']))
+    return inputs
+
+
+@profiled
+def read_inputs(path=INPUT_PATH):
+    """
+    Read the four input sheets of the stock workbook, cleaned as in the scripts:
+    observed stock (Series by year), stock shares by class, weight by class and
+    titanium share by vintage.
+    """
+    planes = pd.read_excel(path, sheet_name="Stock of planes in EU27")
+    planes = planes.rename(columns={"Stock (nº of planes)": "stock"}).set_index('Year')
+    planes.index = planes.index.astype(int)
+
+    stock_by_class = pd.read_excel(path, sheet_name="Stock by class", index_col=0)
+    stock_by_class.index = stock_by_class.index.astype(int)
+    if stock_by_class.dtypes.iloc[0] == object:
+        stock_by_class = stock_by_class.replace({',': '.'}, regex=True).astype(float) / 100
+
+    weight_by_class = pd.read_excel(path, sheet_name="Weight by class", index_col=0).squeeze()
+
+    titanium_share_matrix = pd.read_excel(path, sheet_name="Titanium by vintage", index_col=0)
+    titanium_share_matrix.index = titanium_share_matrix.index.astype(int)
+
+    return {
+        'stock': planes['stock'].astype(float),
+        'stock_by_class': stock_by_class,
+        'weight_by_class': weight_by_class,
+        'titanium_share_matrix': titanium_share_matrix,
+    }
+
+
+def class_shares(stock_by_class, years):
+    """Class shares per year, holding the first observed mix constant back to the start year."""
+    first_year = stock_by_class.index[0]
+    shares = stock_by_class.reindex(years)
+    shares.loc[shares.index < first_year] = stock_by_class.loc[first_year].values
+    return shares.div(shares.sum(axis=1), axis=0)
+
+
+def titanium_per_plane_by_class(shares, weight_by_class, titanium_share_matrix):
+    """Titanium (tons) per delivered plane in each year, split by class (class share x weight x Ti share)."""
+    weight_by_class = weight_by_class.reindex(shares.columns)
+    titanium_share_matrix = titanium_share_matrix.reindex(index=shares.index, columns=shares.columns)
+    return shares.multiply(weight_by_class, axis=1).multiply(titanium_share_matrix)
+
+
+def titanium_per_plane(shares, weight_by_class, titanium_share_matrix):
+    """Titanium (tons) carried by one plane delivered in each year, given the class mix."""
+    return titanium_per_plane_by_class(shares, weight_by_class, titanium_share_matrix).sum(axis=1)
+
+
+def project_stock(years, observed, stock_target=8000, curve_mean_forecast=2040, curve_sd_forecast=10,
+                  curve_mean=1985, curve_sd=10):
+    """
+    Fleet stock over `years`: normal-CDF backcast scaled to the first observed year,
+    observed stock, and a normal-CDF forecast from the last observed year to
+    `stock_target`. Parameters may be arrays of shape (draws,), giving (draws, years).
+    """
+    years = np.asarray(years)
+    first_obs, last_obs = observed.index[0], observed.index[-1]
+    params = [np.asarray(p, dtype=float)[..., None] for p in
+              (stock_target, curve_mean_forecast, curve_sd_forecast, curve_mean, curve_sd)]
+    stock_target, curve_mean_forecast, curve_sd_forecast, curve_mean, curve_sd = params
+    shape = np.broadcast_shapes(*(p.shape[:-1] for p in params)) + (len(years),)
+    stock = np.zeros(shape)
+
+    # === Backcast ===
+    backcast = years < first_obs
+    normal_cdf = scipy.stats.norm.cdf(years[backcast], loc=curve_mean, scale=curve_sd)
+    cdf_first_obs = scipy.stats.norm.cdf(first_obs, loc=curve_mean, scale=curve_sd)
+    stock[..., backcast] = normal_cdf / cdf_first_obs * observed.loc[first_obs]
+
+    # === Observed ===
+    observed = observed.loc[years[0]:years[-1]]
+    stock[..., np.searchsorted(years, observed.index)] = observed.values
+
+    # === Forecast ===
+    forecast = years >= last_obs
+    if forecast.sum() > 1:
+        stock_last = observed.loc[last_obs]
+        cdf = scipy.stats.norm.cdf(years[forecast], loc=curve_mean_forecast, scale=curve_sd_forecast)
+        cdf_scaled = (cdf - cdf[..., :1]) / (cdf[..., -1:] - cdf[..., :1])
+        stock[..., forecast] = stock_last + cdf_scaled * (stock_target - stock_last)
+
+    return stock
+
+
+#%% Time steps
+
+def step_times(start_year, end_year, steps_per_year=1):
+    """Model time points from start_year to end_year in steps of 1/steps_per_year."""
+    return start_year + np.arange((end_year - start_year) * steps_per_year + 1) / steps_per_year
+
+
+def interpolate_steps(annual, steps_per_year):
+    """Linear interpolation of annual values (last axis) onto the sub-annual time points."""
+    annual = np.asarray(annual, dtype=float)
+    if steps_per_year == 1:
+        return annual
+    fraction = np.arange(steps_per_year) / steps_per_year
+    lower, upper = annual[..., :-1, None], annual[..., 1:, None]
+    steps = (lower + (upper - lower) * fraction).reshape(annual.shape[:-1] + (-1,))
+    return np.concatenate((steps, annual[..., -1:]), axis=-1)
+
+
+def annual_groups(n_steps, steps_per_year):
+    """
+    Position of the first step of each year when flows are summed to annual values:
+    a step in (Y-1, Y] counts towards year Y, as in the annual model.
+    """
+    return np.concatenate(([0], np.arange(1, n_steps, steps_per_year)))
+
+
+def to_annual(values, steps_per_year, how='sum'):
+    """Aggregate step values (last axis) to years: 'sum' for flows, 'last' for stocks."""
+    values = np.asarray(values)
+    if steps_per_year == 1:
+        return values
+    if how == 'last':
+        return values[..., ::steps_per_year]
+    return np.add.reduceat(values, annual_groups(values.shape[-1], steps_per_year), axis=-1)
+
+
+#%% Survival curves and matrices
+
+def survival_curve(n_years, mean, sd, steps_per_year=1):
+    """
+    Normal survival function over ages 0..n_years-1 (in time steps), rescaled to
+    start at 1.0. `mean`/`sd` are in years; array-valued `mean`/`sd` of shape
+    (draws,) give one curve per row.
+    """
+    mean = np.asarray(mean, dtype=float)[..., None]
+    sd = np.asarray(sd, dtype=float)[..., None]
+    ages = np.arange(n_years) / steps_per_year
+    curve = scipy.stats.norm.sf(ages, loc=mean, scale=sd)
+    return curve / curve[..., :1]
+
+
+def build_survival_matrix(curve, n_years=None):
+    """Lower-triangular survival matrix S[t, v] = curve[t - v] for t >= v."""
+    curve = np.asarray(curve, dtype=float)
+    n_years = len(curve) if n_years is None else n_years
+    first_col = curve[:n_years]
+    return scipy.linalg.toeplitz(first_col, np.zeros(n_years))
+
+
+class CompactSurvival(NamedTuple):
+    """
+    Survival matrix stored by vintage regime: curves[r] (survival by age) applies to
+    every vintage v with regime[v] == r. Within a regime the matrix is Toeplitz.
+    """
+    curves: np.ndarray
+    regime: np.ndarray
+
+    @property
+    def n_years(self):
+        return len(self.regime)
+
+    def column(self, v, first_age=0):
+        """Survival of vintage v from age `first_age` to the end of the horizon."""
+        return self.curves[self.regime[v], first_age:self.n_years - v]
+
+    def dense(self, stop=None):
+        """Full (n_years x n_years) survival matrix, or only its first `stop` columns (vintages)."""
+        stop = self.n_years if stop is None else stop
+        ages = np.arange(self.n_years)[:, None] - np.arange(stop)
+        S = self.curves[self.regime[:stop], np.maximum(ages, 0)]
+        S[ages < 0] = 0.0
+        return S
+
+
+def compact_survival(years, regimes, steps_per_year=1):
+    """
+    CompactSurvival for survival regimes (see BASELINE) over `years`, which are the
+    model time points (fractional years when steps_per_year > 1). Curves come from
+    the cached dmfa_survival lookup.
+    """
+    years = np.asarray(years)
+    n_years = len(years)
+    starts = [regime[0] for regime in regimes]
+    regime = np.clip(np.searchsorted(starts, years, side='right') - 1, 0, None)
+    curves = np.stack([regime_curve(r, n_years, steps_per_year) for r in regimes])
+    return CompactSurvival(curves, regime)
+
+
+def _as_survival(survival, n_years):
+    if isinstance(survival, CompactSurvival):
+        if survival.n_years != n_years:
+            raise ValueError(f"survival covers {survival.n_years} years, expected {n_years}")
+        return survival
+    survival = np.asarray(survival, dtype=float)
+    if survival.ndim == 1:
+        return CompactSurvival(survival[None, :n_years], np.zeros(n_years, dtype=int))
+    if survival.shape != (n_years, n_years):
+        raise ValueError(f"survival matrix must be {n_years}x{n_years}, got {survival.shape}")
+    return survival
+
+
+def _dense(survival):
+    return survival.dense() if isinstance(survival, CompactSurvival) else survival
+
+
+#%% Stock-driven solver
+
+def _forward_substitution(stock, survival, inflow, survivors, start, stop):
+    """
+    Fill inflow[start:stop] in place: inflow[t] = max(stock[t] - survivors[t], 0), then
+    add its surviving units to all later steps, so each step is a single axpy.
+    """
+    compact = isinstance(survival, CompactSurvival)
+    for t in range(start, stop):
+        inflow[t] = max(stock[t] - survivors[t], 0.0)
+        if inflow[t]:
+            column = survival.column(t, first_age=1) if compact else survival[t + 1:, t]
+            survivors[t + 1:] += column * inflow[t]
+
+
+def _stock_driven_result(stock, inflow, survival, cohort):
+    nas = np.diff(stock, prepend=stock[0])
+    prev_stock = np.concatenate(([0.0], stock[:-1]))
+    outflow = np.clip(prev_stock + inflow - stock, 0, None)
+
+    # Vintage matrix: the first cohort is the initial stock when it has no inflow
+    vintages = None
+    if cohort:
+        cohort_inflow = inflow.copy()
+        if cohort_inflow[0] <= 0:
+            cohort_inflow[0] = stock[0]
+        vintages = vintage_matrix(cohort_inflow, survival)
+
+    return StockDrivenResult(inflow, outflow, nas, vintages)
+
+
+@profiled
+def solve_inflow(stock, survival, cohort=True):
+    """
+    Stock-driven inflow by forward substitution on the lower-triangular survival matrix.
+
+    Same logic as the original per-year loop: no inflow in the first year, then
+    inflow[t] = max(stock[t] - survivors[t], 0), where survivors[t] are the units of
+    earlier vintages still in use. The first-year stock is kept as the initial cohort
+    of the vintage matrix only. `survival` is a survival curve (same curve for every
+    vintage), a CompactSurvival or a full (n_years x n_years) survival matrix. The
+    dense vintage matrix is only built when `cohort` is True.
+    """
+    stock = np.asarray(stock, dtype=float)
+    n_years = len(stock)
+    survival = _as_survival(survival, n_years)
+
+    inflow = np.zeros(n_years)
+    survivors = np.zeros(n_years)
+    _forward_substitution(stock, survival, inflow, survivors, 1, n_years)
+    return _stock_driven_result(stock, inflow, survival, cohort)
+
+
+#%% History checkpoint
+
+class HistoryCheckpoint(NamedTuple):
+    """
+    Cohort state at the last observed step: stock and inflow up to that step, the
+    survivors of those vintages over the whole horizon, the survival they were run
+    with and its dense columns for the historical vintages. The class mix, which
+    does not depend on the forecast either, is kept for run_scenario.
+    """
+    last_step: int
+    stock: np.ndarray
+    inflow: np.ndarray
+    survivors: np.ndarray
+    survival: CompactSurvival
+    history_block: np.ndarray
+    stock_by_class: pd.DataFrame = None
+    shares: pd.DataFrame = None
+    titanium_per_plane: pd.DataFrame = None
+
+
+@profiled
+def history_checkpoint(scenario=BASELINE, inputs=None):
+    """
+    Run the stock-driven model up to the last observed year and keep the cohort state.
+    Backcast and observed stock do not depend on the forecast parameters, so the
+    checkpoint can be resumed (resume_inflow, run_scenario) for any scenario that only
+    changes stock_target, the forecast curve or the survival of later vintages.
+    """
+    scenario = {**BASELINE, **scenario}
+    inputs = load_inputs() if inputs is None else inputs
+    steps_per_year = scenario['steps_per_year']
+    years = np.arange(scenario['start_year'], scenario['end_year'] + 1)
+    times = step_times(scenario['start_year'], scenario['end_year'], steps_per_year)
+    last_step = int(round((inputs['stock'].index[-1] - scenario['start_year']) * steps_per_year))
+
+    annual_stock = project_stock(years, inputs['stock'], **{k: scenario[k] for k in STOCK_PARAMETERS})
+    stock = interpolate_steps(annual_stock, steps_per_year)
+    survival = compact_survival(times, scenario['survival'], steps_per_year)
+
+    inflow = np.zeros(len(times))
+    survivors = np.zeros(len(times))
+    _forward_substitution(stock, survival, inflow, survivors, 1, last_step + 1)
+    shares, ti_per_plane = _class_mix(scenario['stock_by_class'], years, inputs)
+    return HistoryCheckpoint(last_step, stock[:last_step + 1], inflow[:last_step + 1], survivors, survival,
+                             survival.dense(last_step + 1), scenario['stock_by_class'], shares, ti_per_plane)
+
+
+def _check_history(stock, survival, checkpoint):
+    """Raise if the stock or the survival of the historical vintages differ from the checkpoint."""
+    k = checkpoint.last_step
+    if len(stock) != len(checkpoint.survivors) or not np.array_equal(stock[:k + 1], checkpoint.stock):
+        raise ValueError("stock up to the last observed year differs from the checkpoint")
+
+    if isinstance(survival, CompactSurvival):
+        pairs = np.unique(np.stack([survival.regime[:k + 1], checkpoint.survival.regime[:k + 1]]), axis=1)
+        same = all(np.array_equal(survival.curves[new], checkpoint.survival.curves[old]) for new, old in pairs.T)
+    else:
+        same = np.array_equal(survival[:, :k + 1], checkpoint.history_block)
+    if not same:
+        raise ValueError("survival of the historical vintages differs from the checkpoint")
+
+
+def resumed_survival_matrix(survival, checkpoint):
+    """
+    Dense survival matrix with the historical columns taken from the checkpoint and
+    only the forecast vintages filled from `survival`.
+    """
+    n_years, k = survival.n_years, checkpoint.last_step
+    S = np.zeros((n_years, n_years))
+    S[:, :k + 1] = checkpoint.history_block
+    for v in range(k + 1, n_years):
+        S[v:, v] = survival.column(v)
+    return S
+
+
+@profiled
+def resume_inflow(stock, survival, checkpoint, cohort=True):
+    """
+    `solve_inflow` from a HistoryCheckpoint: only the steps after the last observed
+    year are solved. `survival` may differ from the checkpoint for later vintages only
+    (a CompactSurvival, or the dense matrix from resumed_survival_matrix).
+    """
+    stock = np.asarray(stock, dtype=float)
+    n_years = len(stock)
+    survival = _as_survival(survival, n_years)
+    _check_history(stock, survival, checkpoint)
+
+    k = checkpoint.last_step
+    inflow = np.zeros(n_years)
+    inflow[:k + 1] = checkpoint.inflow
+    survivors = checkpoint.survivors.copy()
+    _forward_substitution(stock, survival, inflow, survivors, k + 1, n_years)
+
+    if cohort and isinstance(survival, CompactSurvival):
+        survival = resumed_survival_matrix(survival, checkpoint)
+    return _stock_driven_result(stock, inflow, survival, cohort)
+
+
+@profiled
+def inflow_driven(inflow, survival, cohort=True):
+    """
+    Inflow-driven cohort model (used for titanium): stock by vintage, then NAS and
+    outflow = max(inflow - NAS, 0). With a CompactSurvival the stock is a sum of one
+    convolution per regime and the vintage matrix is only built when `cohort` is True.
+    """
+    inflow = np.asarray(inflow, dtype=float)
+    n_years = len(inflow)
+    survival = _as_survival(survival, n_years)
+
+    vintages = vintage_matrix(inflow, survival) if cohort else None
+    stock = vintages.sum(axis=1) if vintages is not None else cohort_stock(inflow, survival)
+
+    nas = np.diff(stock, prepend=stock[0])
+    outflow = np.clip(inflow - nas, 0, None)
+    return InflowDrivenResult(stock, outflow, nas, vintages)
+
+
+@profiled
+def cohort_stock(inflow, survival):
+    """
+    Stock from inflow by vintage (last axis) without building vintage matrices: one
+    convolution per survival regime. Leading axes (e.g. classes) are kept, as is the dtype.
+    """
+    inflow = np.asarray(inflow)
+    n_years = inflow.shape[-1]
+    survival = _as_survival(survival, n_years)
+    if not isinstance(survival, CompactSurvival):
+        return inflow @ survival.T.astype(inflow.dtype)
+
+    stock = np.zeros_like(inflow)
+    kernel_shape = (1,) * (inflow.ndim - 1) + (-1,)
+    for r, curve in enumerate(survival.curves):
+        regime_inflow = np.where(survival.regime == r, inflow, 0).astype(inflow.dtype)
+        kernel = curve.astype(inflow.dtype).reshape(kernel_shape)
+        stock += scipy.signal.convolve(regime_inflow, kernel)[..., :n_years]
+    return stock
+
+
+def cohort_tensor(inflow_by_class, survival, dtype=np.float32):
+    """
+    Stock by class, year and vintage, shape (classes, years, vintages), from inflow by
+    class and vintage (classes, vintages). Built in one broadcast, stored as `dtype`.
+    """
+    inflow_by_class = np.asarray(inflow_by_class, dtype=dtype)
+    S = _dense(_as_survival(survival, inflow_by_class.shape[-1])).astype(dtype)
+    return S[None, :, :] * inflow_by_class[:, None, :]
+
+
+@profiled
+def vintage_matrix(inflow, survival):
+    """Dense stock by vintage (rows: years, columns: vintages) for the given inflow."""
+    inflow = np.asarray(inflow, dtype=float)
+    S = _dense(_as_survival(survival, len(inflow)))
+    return S * inflow
+
+
+def solve_inflow_batch(stock, curves):
+    """
+    `solve_inflow` for a batch of draws: `stock` and `curves` are (draws, n_years)
+    and each draw has its own survival curve. Only the time loop remains in Python.
+    Returns (inflow, outflow) of shape (draws, n_years).
+    """
+    stock = np.asarray(stock, dtype=float)
+    curves = np.broadcast_to(curves, stock.shape)
+    n_years = stock.shape[-1]
+
+    inflow = np.zeros(stock.shape)
+    survivors = np.zeros(stock.shape)
+    for t in range(1, n_years):
+        inflow[:, t] = np.maximum(stock[:, t] - survivors[:, t], 0.0)
+        survivors[:, t + 1:] += curves[:, 1:n_years - t] * inflow[:, t, None]
+
+    prev_stock = np.concatenate((np.zeros(stock.shape[:-1] + (1,)), stock[:, :-1]), axis=1)
+    outflow = np.clip(prev_stock + inflow - stock, 0, None)
+    return inflow, outflow
+
+
+def convolve_cohorts(inflow, curves):
+    """
+    Stock from inflow for a time-invariant survival curve: stock[t] = sum_v curve[t - v] * inflow[v].
+    Works row-wise on (draws, n_years) arrays.
+    """
+    inflow = np.asarray(inflow, dtype=float)
+    curves = np.broadcast_to(curves, inflow.shape)
+    n_years = inflow.shape[-1]
+    return scipy.signal.fftconvolve(inflow, curves, axes=-1)[..., :n_years]
+
+
+#%% Scenario engine
+
+def _class_mix(stock_by_class, years, inputs):
+    """Class shares by year and titanium (tons) per plane delivered, by class."""
+    stock_by_class = inputs['stock_by_class'] if stock_by_class is None else stock_by_class
+    shares = class_shares(stock_by_class, years)
+    return shares, titanium_per_plane_by_class(shares, inputs['weight_by_class'], inputs['titanium_share_matrix'])
+
+
+def _same_classes(a, b):
+    return a is b or (isinstance(a, pd.DataFrame) and isinstance(b, pd.DataFrame) and a.equals(b))
+
+
+@profiled
+def run_scenario(scenario, inputs=None, vintage_matrices=True, checkpoint=None, cohorts=False):
+    """
+    Run the full fleet and titanium model for one scenario definition (see BASELINE).
+    Returns the result tables keyed as the sheets of the results workbook; the dense
+    vintage tables are left out unless `vintage_matrices` is True. With `cohorts`
+    the titanium stock by class and vintage (cohort_tensor) is added as
+    'titanium_stock_by_class_vintage'. With a HistoryCheckpoint only the forecast
+    segment of the inflow loop is run.
+    """
+    scenario = {**BASELINE, **scenario}
+    inputs = load_inputs() if inputs is None else inputs
+    steps_per_year = scenario['steps_per_year']
+    years = np.arange(scenario['start_year'], scenario['end_year'] + 1)
+    times = step_times(scenario['start_year'], scenario['end_year'], steps_per_year)
+
+    # === Planes ===
+    annual_stock = project_stock(years, inputs['stock'], **{k: scenario[k] for k in STOCK_PARAMETERS})
+    stock = interpolate_steps(annual_stock, steps_per_year)
+    survival = compact_survival(times, scenario['survival'], steps_per_year)
+    if checkpoint is None:
+        cohort_survival = survival
+        planes_flows = solve_inflow(stock, survival, cohort=vintage_matrices)
+    else:
+        _check_history(stock, survival, checkpoint)
+        cohort_survival = resumed_survival_matrix(survival, checkpoint) if vintage_matrices else survival
+        planes_flows = resume_inflow(stock, cohort_survival, checkpoint, cohort=vintage_matrices)
+
+    # === Classes ===
+    if checkpoint is not None and _same_classes(scenario['stock_by_class'], checkpoint.stock_by_class):
+        shares, ti_per_plane = checkpoint.shares, checkpoint.titanium_per_plane
+    else:
+        shares, ti_per_plane = _class_mix(scenario['stock_by_class'], years, inputs)
+    stock_by_class_absolute = shares.multiply(annual_stock, axis=0)
+
+    # === Titanium ===
+    # Planes delivered within a year carry that year's class mix and titanium share;
+    # a step in (Y-1, Y] belongs to year Y, as in annual_groups
+    year_of_step = np.minimum(-(-np.arange(len(times)) // steps_per_year), len(years) - 1)
+    inflow_titanium_by_class = ti_per_plane.fillna(0).to_numpy(dtype=np.float32)[year_of_step].T * planes_flows.inflow.astype(np.float32)
+    inflow_titanium_total = ti_per_plane.sum(axis=1).to_numpy()[year_of_step] * planes_flows.inflow
+    titanium_flows = inflow_driven(inflow_titanium_total, cohort_survival, cohort=vintage_matrices)
+
+    # Per class (classes x steps, float32): stock by convolution, scrap outflow as for the total
+    titanium_stock_by_class = cohort_stock(inflow_titanium_by_class, survival)
+    titanium_nas_by_class = np.diff(titanium_stock_by_class, axis=1, prepend=titanium_stock_by_class[:, :1])
+    titanium_outflow_by_class = np.clip(inflow_titanium_by_class - titanium_nas_by_class, 0, None)
+
+    planes_by_step = pd.DataFrame({
+        'stock': stock,
+        'inflow': planes_flows.inflow,
+        'outflow': planes_flows.outflow,
+        'nas': planes_flows.nas,
+    }, index=times)
+    titanium_by_step = pd.DataFrame({
+        'stock': titanium_flows.stock,
+        'inflow': inflow_titanium_total,
+        'outflow': titanium_flows.outflow,
+        'nas': titanium_flows.nas,
+    }, index=times)
+
+    results = {
+        'name': scenario['name'],
+        'planes_projection': _annual_projection(planes_by_step, years, steps_per_year),
+        'stock_by_class_absolute': stock_by_class_absolute,
+        'titanium_projection': _annual_projection(titanium_by_step, years, steps_per_year),
+        'titanium_stock_by_class': pd.DataFrame(to_annual(titanium_stock_by_class, steps_per_year, 'last').T,
+                                                index=years, columns=shares.columns),
+        'titanium_outflow_by_class': pd.DataFrame(to_annual(titanium_outflow_by_class, steps_per_year).T,
+                                                  index=years, columns=shares.columns),
+    }
+    if vintage_matrices:
+        results['plane_stock_by_vintage'] = _annual_vintages(planes_flows.cohort, years, steps_per_year)
+        results['titanium_stock_by_vintage'] = _annual_vintages(titanium_flows.cohort, years, steps_per_year)
+    if cohorts:
+        results['titanium_stock_by_class_vintage'] = _annual_class_vintages(
+            cohort_tensor(inflow_titanium_by_class, survival), years, steps_per_year, shares.columns)
+    if steps_per_year > 1:
+        results['planes_projection_by_step'] = planes_by_step
+        results['titanium_projection_by_step'] = titanium_by_step
+    return results
+
+
+def _annual_projection(by_step, years, steps_per_year):
+    """Annual table from a step table: stock at the start of each year, flows summed."""
+    if steps_per_year == 1:
+        return by_step.set_axis(years)
+    annual = pd.DataFrame({
+        column: to_annual(by_step[column].to_numpy(), steps_per_year, 'last' if column == 'stock' else 'sum')
+        for column in ['stock', 'inflow', 'outflow']
+    }, index=years)
+    annual['nas'] = annual['stock'].diff().fillna(0)
+    return annual
+
+
+def _annual_vintages(cohort, years, steps_per_year):
+    """Stock by vintage at the start of each year, with sub-annual vintages summed per year."""
+    cohort = to_annual(cohort[::steps_per_year], steps_per_year)
+    return pd.DataFrame(cohort, index=years, columns=years)
+
+
+def _annual_class_vintages(tensor, years, steps_per_year, classes):
+    """Stock by class and vintage (columns) at the start of each year, as _annual_vintages per class."""
+    tensor = to_annual(tensor[:, ::steps_per_year], steps_per_year)
+    columns = pd.MultiIndex.from_product([classes, years], names=['class', 'vintage'])
+    return pd.DataFrame(tensor.transpose(1, 0, 2).reshape(len(years), -1), index=years, columns=columns)
+
+
+_worker_inputs = None
+_worker_checkpoint = None
+
+
+def _init_worker(inputs, checkpoint=None):
+    global _worker_inputs, _worker_checkpoint
+    _worker_inputs = inputs
+    _worker_checkpoint = checkpoint
+    reset_profile()
+
+
+def _run_in_worker(scenario, vintage_matrices):
+    return run_scenario(scenario, _worker_inputs, vintage_matrices, _worker_checkpoint), take_profile()
+
+
+@profiled
+def run_scenarios(scenarios, inputs=None, max_workers=None, vintage_matrices=False, checkpoint=None):
+    """
+    Run many scenarios in a process pool. The workbook is read once and shared with
+    the workers. Returns {scenario name: results} in the order given; dense vintage
+    tables are only included when `vintage_matrices` is True. A HistoryCheckpoint
+    shared by all scenarios (forecast variants) skips the historical inflow loop.
+    """
+    inputs = load_inputs() if inputs is None else inputs
+    scenarios = [{**BASELINE, **scenario} for scenario in scenarios]
+    names = [scenario['name'] for scenario in scenarios]
+    if len(set(names)) != len(names):
+        raise ValueError("scenario names must be unique")
+
+    with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker,
+                             initargs=(inputs, checkpoint)) as pool:
+        outputs = list(pool.map(_run_in_worker, scenarios, [vintage_matrices] * len(scenarios),
+                                chunksize=max(1, len(scenarios) // 32)))
+    for _, records in outputs:
+        merge_profile(records)
+    return dict(zip(names, [results for results, _ in outputs]))
+
+
+#%% Example: sweep of the LTE switch year
+if __name__ == '__main__':
+    sweep = [{**LTE, 'name': f'LTE {switch}', 'survival': [(1970, 25, 12.5), (switch, 35, 12.5)]}
+             for switch in range(2024, 2074)]
+    results = run_scenarios(sweep, checkpoint=history_checkpoint(LTE))
+    peak_outflow = pd.Series({name: r['titanium_projection']['outflow'].max() for name, r in results.items()})
+    print(peak_outflow.round(0))
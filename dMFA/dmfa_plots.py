@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Headless figure rendering for the dMFA results. Figures are drawn from NumPy
+arrays (vintage area plots with stackplot) on matplotlib Figure objects without
+pyplot, so they are rendered by Agg whatever the active backend, in parallel, and
+skipped when their inputs have not changed since the last render.
+"""
+
+import hashlib
+import inspect
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import matplotlib
+from matplotlib.figure import Figure
+
+from pipeline_profile import profiled, stage, reset as reset_profile, take as take_profile, merge as merge_profile
+
+MANIFEST = '.render_manifest.json'
+
+# Period markers of the stock plots: (year, label)
+PERIODS = [(1970, 'Backcast'), (2000, 'Observed'), (2023, 'Forecast')]
+
+
+#%% Figure builders (arrays in, Figure out)
+
+def _period_markers(ax, rotation):
+    for year, label in PERIODS:
+        ax.axvline(x=year, color='k', linestyle='--', linewidth=1)
+    top = ax.get_ylim()[1] * 0.95
+    for year, label in PERIODS:
+        ax.text(year + 0.3, top, label, rotation=rotation, verticalalignment='top', fontsize=9)
+
+
+def _decorate(ax, title=None, xlabel='Year', ylabel=None, grid=None, title_size=None):
+    if title is not None:
+        ax.set_title(title, fontsize=title_size)
+    ax.set_xlabel(xlabel)
+    ax.set_ylabel(ylabel)
+    if grid is not None:
+        ax.grid(grid)
+
+
+def draw_lines(ax, x, lines):
+    for label, values in lines.items():
+        ax.plot(x, values, label=label)
+    ax.legend()
+
+
+def draw_vintages(ax, years, vintages, bin_vintages=None):
+    """Stacked area of stock by vintage (years x vintages), optionally binned into `bin_vintages`-year groups."""
+    vintages = np.asarray(vintages)
+    if bin_vintages:
+        groups = (np.asarray(years) - years[0]) // bin_vintages
+        starts = np.flatnonzero(np.diff(groups, prepend=-1))
+        vintages = np.add.reduceat(vintages, starts, axis=1)
+    ax.stackplot(years, vintages.T)
+    ax.set_ylim(bottom=0)
+
+
+def line_figure(x, lines, title=None, ylabel=None, figsize=(12, 6), grid=None, period_rotation=None,
+                title_size=None):
+    fig = Figure(figsize=figsize)
+    ax = fig.subplots()
+    draw_lines(ax, x, lines)
+    if len(lines) == 1:
+        ax.get_legend().remove()
+    if period_rotation is not None:
+        _period_markers(ax, period_rotation)
+    _decorate(ax, title, ylabel=ylabel, grid=grid, title_size=title_size)
+    fig.tight_layout()
+    return fig
+
+
+def vintage_figure(years, vintages, title=None, ylabel=None, figsize=(12, 6), period_rotation=None, bin_vintages=None):
+    fig = Figure(figsize=figsize)
+    ax = fig.subplots()
+    draw_vintages(ax, years, vintages, bin_vintages)
+    if period_rotation is not None:
+        _period_markers(ax, period_rotation)
+    _decorate(ax, title, ylabel=ylabel)
+    fig.tight_layout()
+    return fig
+
+
+def combined_titanium_figure(years, inflow, outflow, vintages, bin_vintages=None):
+    fig = Figure(figsize=(12, 10))
+    axes = fig.subplots(2, 1, sharex=False)
+
+    draw_lines(axes[0], years, {'Inflow': inflow, 'Outflow': outflow})
+    _decorate(axes[0], 'Titanium inflow and outflow in the EU aircraft fleet (1970–2040)',
+              ylabel='Titanium (tons/year)', grid=False, title_size=14)
+
+    draw_vintages(axes[1], years, vintages, bin_vintages)
+    _decorate(axes[1], 'Titanium stock evolution by vintage within the EU aircraft fleet (1970–2040)',
+              ylabel='Titanium (tons)', grid=False, title_size=14)
+
+    fig.tight_layout()
+    return fig
+
+
+#%% Figure set of one scenario run
+
+def scenario_figures(results, prefix, vintage_rotation=0, vintage_title=None, grid=False, combined=True,
+                     bin_vintages=None):
+    """
+    Render jobs for the standard figures of one scenario (see render_figures).
+    The keyword arguments cover the differences between the Baseline and LTE figures.
+    """
+    planes = results['planes_projection']
+    titanium = results['titanium_projection']
+    years = planes.index.to_numpy()
+
+    def column(table, name):
+        return table[name].to_numpy()
+
+    jobs = [
+        {'file': f'1. {prefix} - planes_inflow_outflow_nas.png', 'dpi': 300, 'figure': line_figure,
+         'args': {'x': years, 'lines': {c: column(planes, c) for c in ['inflow', 'outflow', 'nas']},
+                  'title': 'Aircraft Inflow, Outflow, and NAS', 'ylabel': 'Number of Planes'}},
+        {'file': f'2. {prefix} - planes_stock_over_time.png', 'dpi': 300, 'figure': line_figure,
+         'args': {'x': years, 'lines': {'stock': column(planes, 'stock')}, 'period_rotation': 90,
+                  'title': 'Aircraft Stock Over Time', 'ylabel': 'Number of Planes'}},
+        {'file': f'3. {prefix} - aircraft_survival_matrix.png', 'dpi': 600, 'figure': vintage_figure,
+         'args': {'years': years, 'vintages': results['plane_stock_by_vintage'].to_numpy(),
+                  'period_rotation': vintage_rotation, 'title': vintage_title, 'ylabel': 'Number of planes',
+                  'bin_vintages': bin_vintages}},
+        {'file': f'4. {prefix} - titanium_survival_matrix.png', 'dpi': 300, 'figure': vintage_figure,
+         'args': {'years': years, 'vintages': results['titanium_stock_by_vintage'].to_numpy(),
+                  'title': 'Titanium Survival Matrix', 'ylabel': 'Titanium (tons)', 'bin_vintages': bin_vintages}},
+        {'file': f'5. {prefix} - titanium_inflow_outflow.png', 'dpi': 300, 'figure': line_figure,
+         'args': {'x': years, 'lines': {'Inflow': column(titanium, 'inflow'), 'Outflow': column(titanium, 'outflow')},
+                  'title': 'Titanium Inflow and Outflow Over Time', 'title_size': 14,
+                  'ylabel': 'Titanium (tons/year)', 'figsize': (10, 5), 'grid': grid}},
+        {'file': f'6. {prefix} - titanium_total_stock.png', 'dpi': 300, 'figure': line_figure,
+         'args': {'x': years, 'lines': {'stock': column(titanium, 'stock')},
+                  'title': 'Total Titanium Stock in Aircraft Over Time', 'title_size': 14,
+                  'ylabel': 'Titanium in stock (tons)', 'figsize': (10, 5), 'grid': grid}},
+    ]
+    if combined:
+        jobs.append({'file': 'Combined_Titanium_Plots.png', 'dpi': 300, 'figure': combined_titanium_figure,
+                     'args': {'years': years, 'inflow': column(titanium, 'inflow'),
+                              'outflow': column(titanium, 'outflow'),
+                              'vintages': results['titanium_stock_by_vintage'].to_numpy(),
+                              'bin_vintages': bin_vintages}})
+    return jobs
+
+
+#%% Rendering
+
+def _code(builder):
+    """
+    The builder's bytecode, constants and names, with the source of its module (the
+    helpers it draws with) when that is available.
+    """
+    code = builder.__code__
+    try:
+        source = inspect.getsource(inspect.getmodule(builder))
+    except (OSError, TypeError):
+        source = None
+    return [code.co_code.hex(), repr(code.co_consts), code.co_names, source]
+
+
+def _fingerprint(job):
+    """Hash of everything that determines a figure: builder code, arguments and dpi."""
+    digest = hashlib.sha256()
+
+    def feed(obj):
+        if isinstance(obj, np.ndarray):
+            digest.update(f'{obj.dtype}{obj.shape}'.encode())
+            digest.update(np.ascontiguousarray(obj).tobytes())
+        elif isinstance(obj, dict):
+            for key in obj:
+                digest.update(repr(key).encode())
+                feed(obj[key])
+        elif isinstance(obj, (list, tuple)):
+            for item in obj:
+                feed(item)
+        else:
+            digest.update(repr(obj).encode())
+
+    feed([job['figure'].__module__, job['figure'].__qualname__, _code(job['figure']), job['dpi'], job['args']])
+    return digest.hexdigest()
+
+
+def _init_worker():
+    matplotlib.use('Agg')
+    reset_profile()
+
+
+def _render(job, path):
+    with stage(f"draw {job['file']}"):
+        fig = job['figure'](**job['args'])
+    with stage(f"savefig {job['file']}"):
+        fig.savefig(path, dpi=job['dpi'])
+    return path
+
+
+def _render_in_worker(job, path):
+    _render(job, path)
+    return take_profile()
+
+
+@profiled
+def render_figures(jobs, out_dir, max_workers=None, force=False):
+    """
+    Render figure jobs ({'file', 'dpi', 'figure': builder, 'args'}) into `out_dir` on
+    the Agg backend, in parallel worker processes (in this process for a single
+    figure or worker: the builders return pyplot-free Figures). Figures whose inputs match the
+    last render (recorded in a manifest in `out_dir`) are skipped unless `force`.
+    Returns the list of files rendered.
+    """
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    manifest_path = out_dir / MANIFEST
+    manifest = json.loads(manifest_path.read_text()) if manifest_path.exists() else {}
+
+    todo = []
+    for job in jobs:
+        fingerprint = _fingerprint(job)
+        if force or manifest.get(job['file']) != fingerprint or not (out_dir / job['file']).exists():
+            todo.append((job, fingerprint))
+
+    max_workers = min(len(todo), max_workers or os.cpu_count() or 1)
+    if max_workers <= 1:
+        for job, _ in todo:
+            _render(job, out_dir / job['file'])
+    elif todo:
+        with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker) as pool:
+            for records in pool.map(_render_in_worker, [job for job, _ in todo], [out_dir / job['file'] for job, _ in todo]):
+                merge_profile(records)
+
+    manifest.update({job['file']: fingerprint for job, fingerprint in todo})
+    manifest_path.write_text(json.dumps(manifest, indent=1))
+    return [job['file'] for job, _ in todo]
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Global sensitivity analysis of the dMFA model: Sobol indices (Saltelli design)
+and Morris elementary effects, evaluated with the batched ensemble model.
+"""
+
+import numpy as np
+import pandas as pd
+import scipy.stats
+
+from dmfa_model import load_inputs
+from dmfa_ensemble import run_ensemble
+
+# Parameter ranges (uniform) around the thesis values
+PARAMETER_BOUNDS = {
+    'curve_surv_mean': (20, 30),
+    'curve_surv_sd': (8, 17),
+    'curve_mean_forecast': (2035, 2045),
+    'stock_target': (7000, 9000),
+}
+
+
+def _scale(unit, bounds):
+    low, high = np.array(list(bounds.values()), dtype=float).T
+    return pd.DataFrame(low + unit * (high - low), columns=list(bounds))
+
+
+def evaluate(design, output='titanium_outflow', years=None, inputs=None, batch_size=5000):
+    """
+    Run the model on every row of a parameter design in vectorized batches.
+    Returns the output as a (rows, years) DataFrame, optionally restricted to `years`.
+    """
+    inputs = load_inputs() if inputs is None else inputs
+    batches = []
+    for start in range(0, len(design), batch_size):
+        results = run_ensemble(design.iloc[start:start + batch_size], inputs)
+        batches.append(pd.DataFrame(results[output], columns=results['years']))
+    values = pd.concat(batches, ignore_index=True)
+    return values if years is None else values[list(years)]
+
+
+#%% Sobol (Saltelli design)
+
+def saltelli_sample(n, bounds=None, seed=None):
+    """
+    Saltelli design: matrices A and B (n rows each, scrambled Sobol sequence) and, for
+    each parameter i, A with column i taken from B. Rows are stacked as
+    [A, B, AB_1, ..., AB_d], n * (d + 2) model runs in total.
+    """
+    bounds = PARAMETER_BOUNDS if bounds is None else bounds
+    d = len(bounds)
+    base = scipy.stats.qmc.Sobol(2 * d, scramble=True, seed=seed).random(n)
+    A, B = base[:, :d], base[:, d:]
+    AB = np.repeat(A[None], d, axis=0)
+    AB[np.arange(d), :, np.arange(d)] = B.T
+    return _scale(np.concatenate([A, B, AB.reshape(-1, d)]), bounds)
+
+
+def sobol_indices(values, n, parameters):
+    """
+    First-order (Saltelli 2010) and total (Jansen) Sobol indices from the model
+    output on a Saltelli design, for every output column (e.g. year) at once.
+    """
+    y = np.asarray(values, dtype=float)
+    d = len(parameters)
+    y_A, y_B, y_AB = y[:n], y[n:2 * n], y[2 * n:].reshape(d, n, -1)
+    variance = np.concatenate([y_A, y_B]).var(axis=0)
+    variance = np.where(variance > 0, variance, np.nan)
+
+    first = (y_B * (y_AB - y_A)).mean(axis=1) / variance
+    total = 0.5 * ((y_A - y_AB) ** 2).mean(axis=1) / variance
+
+    columns = values.columns if isinstance(values, pd.DataFrame) else range(y.shape[1])
+    index = pd.MultiIndex.from_product([columns, parameters], names=['year', 'parameter'])
+    return pd.DataFrame({'S1': first.T.ravel(), 'ST': total.T.ravel()}, index=index)
+
+
+def sobol_analysis(n=4096, years=(2030, 2040, 2050, 2060), bounds=None, output='titanium_outflow',
+                   inputs=None, seed=None):
+    """Sobol indices of `output` in the chosen years; n * (d + 2) model evaluations."""
+    bounds = PARAMETER_BOUNDS if bounds is None else bounds
+    design = saltelli_sample(n, bounds, seed)
+    values = evaluate(design, output, years, inputs)
+    return sobol_indices(values, n, list(bounds))
+
+
+#%% Morris elementary effects
+
+def morris_sample(r, bounds=None, levels=4, seed=None):
+    """
+    r Morris trajectories of d + 1 points on a `levels` grid. Each step changes one
+    parameter (in random order) by +/- delta. Returns the design and, per step, the
+    parameter changed and the signed step in unit scale.
+    """
+    bounds = PARAMETER_BOUNDS if bounds is None else bounds
+    d = len(bounds)
+    rng = np.random.default_rng(seed)
+    delta = levels / (2 * (levels - 1))
+
+    points = np.empty((r, d + 1, d))
+    points[:, 0] = rng.integers(0, levels, size=(r, d)) / (levels - 1)
+    order = rng.permuted(np.tile(np.arange(d), (r, 1)), axis=1)
+    steps = np.empty((r, d))
+    for k in range(d):
+        current = points[:, k].copy()
+        changed = current[np.arange(r), order[:, k]]
+        steps[:, k] = np.where(changed + delta <= 1, delta, -delta)
+        current[np.arange(r), order[:, k]] = changed + steps[:, k]
+        points[:, k + 1] = current
+
+    return _scale(points.reshape(-1, d), bounds), order, steps
+
+
+def morris_effects(values, order, steps, parameters):
+    """
+    mu* (mean absolute), mu and sigma of the elementary effects per output column and
+    parameter; effects are per unit of the parameter range.
+    """
+    y = np.asarray(values, dtype=float)
+    r, d = order.shape
+    y = y.reshape(r, d + 1, -1)
+    effects = np.diff(y, axis=1) / steps[..., None]
+
+    # Reorder so that effects[:, i] belongs to parameter i
+    effects = np.take_along_axis(effects, np.argsort(order, axis=1)[..., None], axis=1)
+
+    columns = values.columns if isinstance(values, pd.DataFrame) else range(y.shape[-1])
+    index = pd.MultiIndex.from_product([columns, parameters], names=['year', 'parameter'])
+    return pd.DataFrame({
+        'mu_star': np.abs(effects).mean(axis=0).T.ravel(),
+        'mu': effects.mean(axis=0).T.ravel(),
+        'sigma': effects.std(axis=0, ddof=1).T.ravel(),
+    }, index=index)
+
+
+def morris_analysis(r=100, years=(2030, 2040, 2050, 2060), bounds=None, output='titanium_outflow',
+                    levels=4, inputs=None, seed=None):
+    """Morris screening of `output` in the chosen years; r * (d + 1) model evaluations."""
+    bounds = PARAMETER_BOUNDS if bounds is None else bounds
+    design, order, steps = morris_sample(r, bounds, levels, seed)
+    values = evaluate(design, output, years, inputs)
+    return morris_effects(values, order, steps, list(bounds))
+
+
+#%% Example: Sobol indices of titanium outflow (4096 * 6 = 24,576 model runs)
+if __name__ == '__main__':
+    print(sobol_analysis(n=4096, seed=1).round(3))
+    print(morris_analysis(r=200, seed=1).round(1))
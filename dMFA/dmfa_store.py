@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Results store for dMFA scenario runs: one SQLite file with a table per result
+(planes_projection, titanium_projection, vintage and class tables), keyed by
+scenario and year at full precision. Excel export is kept as a separate step.
+"""
+
+import sqlite3
+from pathlib import Path
+
+import pandas as pd
+
+from pipeline_profile import profiled
+
+RESULTS_DB = Path(__file__).parent / 'Results' / 'dMFA results.sqlite'
+
+EXCEL_SHEETS = ['planes_projection', 'plane_stock_by_vintage', 'stock_by_class_absolute',
+                'titanium_projection', 'titanium_stock_by_vintage']
+
+PROJECTION_COLUMNS = ['stock', 'inflow', 'outflow', 'nas']
+
+
+def _long_table(name, table):
+    """Result table in the store layout: one row per (year, column) except for projections."""
+    if name.startswith(('planes_projection', 'titanium_projection')):
+        long = table[PROJECTION_COLUMNS].rename_axis('year').reset_index()
+    elif table.columns.nlevels > 1:
+        # Stock by class and vintage: one row per (year, class, vintage)
+        long = table.rename_axis(index='year').stack(['class', 'vintage'], future_stack=True).rename('value').reset_index()
+        long = long[long['vintage'] <= long['year']]
+    else:
+        key = 'vintage' if name.endswith('by_vintage') else 'class'
+        long = table.rename_axis(index='year', columns=key).stack().rename('value').reset_index()
+        if key == 'vintage':
+            long = long[long['vintage'] <= long['year']]  # vintages never live before they enter
+    return long
+
+
+def _tables(con):
+    return {row[0] for row in con.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+
+
+@profiled
+def save_results(results, db=RESULTS_DB, scenario=None):
+    """
+    Store (or replace) one scenario's results. `scenario` defaults to results['name'].
+    Every DataFrame in `results` is written to the table of the same name.
+    """
+    scenario = results['name'] if scenario is None else scenario
+    Path(db).parent.mkdir(parents=True, exist_ok=True)
+
+    with sqlite3.connect(db) as con:
+        existing = _tables(con)
+        for name, table in results.items():
+            if not isinstance(table, pd.DataFrame):
+                continue
+            long = _long_table(name, table)
+            long.insert(0, 'scenario', scenario)
+            if name in existing:
+                con.execute(f'DELETE FROM "{name}" WHERE scenario = ?', (scenario,))
+            long.to_sql(name, con, if_exists='append', index=False)
+            con.execute(f'CREATE INDEX IF NOT EXISTS "idx_{name}" ON "{name}" (scenario, year)')
+
+
+def save_many(results_by_scenario, db=RESULTS_DB):
+    """Store the output of dmfa_model.run_scenarios."""
+    for scenario, results in results_by_scenario.items():
+        save_results(results, db, scenario)
+
+
+def list_scenarios(db=RESULTS_DB, table='planes_projection'):
+    with sqlite3.connect(db) as con:
+        return [row[0] for row in con.execute(f'SELECT DISTINCT scenario FROM "{table}" ORDER BY scenario')]
+
+
+def load_table(table, db=RESULTS_DB, scenarios=None, years=None):
+    """
+    Read one result table, optionally filtered by scenario names and a (first, last)
+    year range. Projection tables come back indexed by (scenario, year); vintage and
+    class tables are pivoted back to one column per vintage or class (or per
+    (class, vintage) pair).
+    """
+    query, params = f'SELECT * FROM "{table}" WHERE 1 = 1', []
+    if scenarios is not None:
+        scenarios = list(scenarios)
+        query += f' AND scenario IN ({", ".join("?" * len(scenarios))})'
+        params += scenarios
+    if years is not None:
+        query += ' AND year BETWEEN ? AND ?'
+        params += [int(years[0]), int(years[1])]
+
+    with sqlite3.connect(db) as con:
+        long = pd.read_sql_query(query, con, params=params)
+
+    if 'value' not in long:
+        return long.set_index(['scenario', 'year'])
+    keys = [key for key in ('class', 'vintage') if key in long]
+    wide = long.pivot_table(index=['scenario', 'year'], columns=keys, values='value', aggfunc='sum', fill_value=0.0)
+    return wide.rename_axis(columns=None) if len(keys) == 1 else wide
+
+
+@profiled
+def export_excel(results, path):
+    """Rounded, formatted Excel workbook with the five result sheets, as in the original scripts."""
+    with pd.ExcelWriter(path, engine='xlsxwriter') as writer:
+        for sheet_name in EXCEL_SHEETS:
+            results[sheet_name].round(0).astype('Int64').to_excel(writer, sheet_name=sheet_name)
+
+        for sheet_name in EXCEL_SHEETS:
+            worksheet = writer.sheets[sheet_name]
+            worksheet.freeze_panes(1, 1)
+            worksheet.set_zoom(90)
+            worksheet.set_column('A:ZZ', 15)
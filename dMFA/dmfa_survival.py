@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Survival distribution library. Curves are evaluated on the model age grid,
+rescaled to start at 1.0 and memoized per (distribution, parameters, horizon,
+time step), so sweeps and ensembles reuse them instead of recomputing.
+"""
+
+from functools import lru_cache
+
+import numpy as np
+import scipy.stats
+
+
+#%% Distributions: survival function of age in years
+
+def _normal(ages, mean, sd):
+    return scipy.stats.norm.sf(ages, loc=mean, scale=sd)
+
+
+def _weibull(ages, shape, scale):
+    return scipy.stats.weibull_min.sf(ages, shape, scale=scale)
+
+
+def _lognormal(ages, mean, sd):
+    # Parameterized by the mean and sd of the lifetime in years
+    sigma2 = np.log1p((sd / mean) ** 2)
+    return scipy.stats.lognorm.sf(ages, np.sqrt(sigma2), scale=mean * np.exp(-sigma2 / 2))
+
+
+def _gamma(ages, mean, sd):
+    # Parameterized by the mean and sd of the lifetime in years
+    return scipy.stats.gamma.sf(ages, (mean / sd) ** 2, scale=sd ** 2 / mean)
+
+
+def _empirical(ages, *survival):
+    # Survival at ages 0, 1, 2, ... years; linear in between, zero after the table
+    table_ages = np.arange(len(survival))
+    return np.interp(ages, table_ages, survival, right=0.0)
+
+
+DISTRIBUTIONS = {
+    'normal': _normal,          # (mean, sd)
+    'weibull': _weibull,        # (shape, scale)
+    'lognormal': _lognormal,    # (mean, sd)
+    'gamma': _gamma,            # (mean, sd)
+    'empirical': _empirical,    # survival share at ages 0, 1, 2, ... years
+}
+
+
+def register_distribution(name, survival_function):
+    """Add a distribution: survival_function(ages_in_years, *params) -> survival shares."""
+    DISTRIBUTIONS[name] = survival_function
+    _cached_curve.cache_clear()
+
+
+#%% Cached lookup
+
+@lru_cache(maxsize=4096)
+def _cached_curve(distribution, params, n_steps, steps_per_year):
+    ages = np.arange(n_steps) / steps_per_year
+    curve = np.asarray(DISTRIBUTIONS[distribution](ages, *params), dtype=float)
+    curve = curve / curve[0]
+    curve.setflags(write=False)
+    return curve
+
+
+def distribution_curve(distribution, params, n_steps, steps_per_year=1):
+    """
+    Survival by age step (0..n_steps-1) for a registered distribution, starting at
+    1.0. The returned array is shared between callers and read-only.
+    """
+    if distribution not in DISTRIBUTIONS:
+        raise KeyError(f"unknown survival distribution '{distribution}', choose from {sorted(DISTRIBUTIONS)}")
+    params = tuple(float(p) for p in np.atleast_1d(params))
+    return _cached_curve(distribution, params, int(n_steps), int(steps_per_year))
+
+
+def regime_curve(regime, n_steps, steps_per_year=1):
+    """
+    Curve of a scenario survival regime: (first vintage year, mean, sd) for a normal
+    curve, or (first vintage year, distribution, params).
+    """
+    _, *spec = regime
+    if isinstance(spec[0], str):
+        distribution, params = spec
+    else:
+        distribution, params = 'normal', spec
+    return distribution_curve(distribution, params, n_steps, steps_per_year)
+
+
+cache_info = _cached_curve.cache_info
@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Per-stage timing and memory instrumentation for the dMFA and MRIO pipelines.
+Stages are marked with `stage(name)` (context manager) or `@profiled` (decorator)
+and record wall time, CPU time (own and of finished child processes) and peak RSS.
+Nested stages are reported as 'outer/inner'.
+
+Switched on by the environment variable PIPELINE_PROFILE=1; when it is not set,
+`profiled` returns the function unchanged and `stage` a shared no-op context.
+At the end of a profiled run a summary is printed and a JSON report is written to
+PIPELINE_PROFILE_DIR (default: 'Profiles' in the working directory).
+"""
+
+import atexit
+import contextlib
+import datetime
+import functools
+import json
+import multiprocessing
+import os
+import sys
+import time
+from pathlib import Path
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+ENABLED = os.environ.get('PIPELINE_PROFILE', '').lower() not in ('', '0', 'false', 'no', 'off')
+REPORT_DIR = Path(os.environ.get('PIPELINE_PROFILE_DIR', 'Profiles'))
+
+_NULL = contextlib.nullcontext()
+_records = {}   # stage path -> accumulated measurements
+_stack = []     # open stages
+_start = time.perf_counter()
+
+
+#%% Memory
+
+def _reset_peak_rss():
+    """Reset the peak RSS of this process (Linux only; elsewhere the lifetime peak is reported)."""
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except OSError:
+        pass
+
+
+def _peak_rss_mb():
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2 ** 20 if sys.platform == 'darwin' else peak / 1024
+
+
+def _children_cpu():
+    if resource is None:
+        return 0.0
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+#%% Stages
+
+class _Stage:
+    __slots__ = ('name', 'path', 'wall', 'cpu', 'children_cpu', 'child_peak')
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.path = f'{_stack[-1].path}/{self.name}' if _stack else self.name
+        self.child_peak = None
+        if _stack:
+            # The peak of the enclosing stage so far, before it is reset for this one
+            _stack[-1].child_peak = _max(_stack[-1].child_peak, _peak_rss_mb())
+        _stack.append(self)
+        _reset_peak_rss()
+        self.children_cpu = _children_cpu()
+        self.cpu = time.process_time()
+        self.wall = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        wall = time.perf_counter() - self.wall
+        cpu = time.process_time() - self.cpu
+        children_cpu = _children_cpu() - self.children_cpu
+        peak = _max(_peak_rss_mb(), self.child_peak)
+        _stack.pop()
+        if _stack:
+            # Resetting the peak inside this stage hides it from the enclosing one
+            _stack[-1].child_peak = _max(_stack[-1].child_peak, peak)
+        _add(self.path, len(_stack), 1, wall, cpu, children_cpu, peak)
+        return False
+
+
+def _max(a, b):
+    return b if a is None else a if b is None else max(a, b)
+
+
+def _add(path, depth, calls, wall, cpu, children_cpu, peak):
+    record = _records.setdefault(path, {'stage': path, 'depth': depth, 'calls': 0, 'wall_s': 0.0, 'cpu_s': 0.0,
+                                        'cpu_children_s': 0.0, 'peak_rss_mb': None})
+    record['calls'] += calls
+    record['wall_s'] += wall
+    record['cpu_s'] += cpu
+    record['cpu_children_s'] += children_cpu
+    record['peak_rss_mb'] = _max(record['peak_rss_mb'], peak)
+
+
+def stage(name):
+    """Context manager timing the enclosed block as stage `name` (no-op unless enabled)."""
+    return _Stage(name) if ENABLED else _NULL
+
+
+def profiled(name=None):
+    """
+    Decorator recording each call as a stage, named after the function unless `name`
+    is given. Usable as @profiled or @profiled('name'); returns the function itself
+    when profiling is disabled.
+    """
+    def decorate(function, label=None):
+        if not ENABLED:
+            return function
+        label = label or function.__qualname__
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with _Stage(label):
+                return function(*args, **kwargs)
+        return wrapper
+
+    if callable(name):
+        return decorate(name)
+    return lambda function: decorate(function, name)
+
+
+#%% Worker processes
+
+def reset():
+    """Drop all records and open stages, e.g. in a forked pool worker (call from its initializer)."""
+    _records.clear()
+    _stack.clear()
+
+
+def take():
+    """Records of this process so far, cleared; return them from pool workers and pass them to merge()."""
+    records = list(_records.values())
+    _records.clear()
+    return records
+
+
+def merge(records):
+    """Add records from a worker process under the currently open stage."""
+    prefix, depth = (f'{_stack[-1].path}/', len(_stack)) if _stack else ('', 0)
+    for record in records:
+        _add(prefix + record['stage'], depth + record['depth'], record['calls'], record['wall_s'],
+             record['cpu_s'], record['cpu_children_s'], record['peak_rss_mb'])
+
+
+#%% Report
+
+def records():
+    """Accumulated stage records, parents before their children."""
+    return sorted(_records.values(), key=lambda record: record['stage'].split('/'))
+
+
+def summary():
+    """Console table of the stage records."""
+    lines = [f"{'stage':56} {'calls':>6} {'wall s':>10} {'cpu s':>10} {'child cpu s':>12} {'peak MB':>10}"]
+    for record in records():
+        name = '  ' * record['depth'] + record['stage'].rsplit('/', 1)[-1]
+        peak = '' if record['peak_rss_mb'] is None else f"{record['peak_rss_mb']:10.1f}"
+        lines.append(f"{name[:56]:56} {record['calls']:6d} {record['wall_s']:10.3f} {record['cpu_s']:10.3f} "
+                     f"{record['cpu_children_s']:12.3f} {peak:>10}")
+    return '\n'.join(lines)
+
+
+def report(path=None, console=True):
+    """
+    Print the summary and write the JSON report (metadata and stage records) to
+    `path`, by default REPORT_DIR/'<script> <date>.json'. Returns the path.
+    """
+    script = Path(sys.argv[0]).stem if sys.argv and sys.argv[0] not in ('', '-c') else 'interactive'
+    date = datetime.datetime.now()
+    if path is None:
+        path = REPORT_DIR / f"{script} {date.strftime('%Y-%m-%d %H-%M-%S')}.json"
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps({
+        'script': script,
+        'date': date.isoformat(timespec='seconds'),
+        'total_wall_s': time.perf_counter() - _start,
+        'peak_rss_mb': functools.reduce(_max, (record['peak_rss_mb'] for record in records()), _peak_rss_mb()),
+        'stages': records(),
+    }, indent=1))
+    if console:
+        print(summary())
+        print(f'Profile written to {path}')
+    return path
+
+
+def _report_at_exit():
+    if _records and multiprocessing.parent_process() is None:
+        report()
+
+
+if ENABLED:
+    atexit.register(_report_at_exit)
@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Checks of the calibration residuals and their Jacobians on the observed fleet stock.
+"""
+
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, str(Path(__file__).parents[1] / 'dMFA'))
+from dmfa_calibration import PARAMETER_BOUNDS, backcast_residuals, stock_residuals
+from dmfa_model import BASELINE, convolve_cohorts, load_inputs, project_stock, solve_inflow_batch, survival_curve
+
+NAMES = list(PARAMETER_BOUNDS)
+
+
+@pytest.fixture(scope='module')
+def observed():
+    return load_inputs()['stock']
+
+
+def _central_differences(function, x):
+    step = 1e-5 * np.maximum(np.abs(x), 1)
+    return np.stack([(function(x + h) - function(x - h)) / (2 * h[k]) for k, h in enumerate(np.diag(step))], axis=-1)
+
+
+@pytest.mark.parametrize('x', [[25, 8, 1985, 10], [30, 12, 1975, 7], [12, 4, 1990, 15]])
+def test_stock_jacobian_matches_central_differences(observed, x):
+    x = np.array(x, dtype=float)
+    retirements = pd.Series(np.linspace(10, 300, len(observed)), index=observed.index)
+    deliveries = pd.Series(np.linspace(100, 500, len(observed)), index=observed.index)
+
+    def residuals(point):
+        return stock_residuals(point, NAMES, observed, BASELINE, retirements, deliveries)[0]
+
+    values, jacobian = stock_residuals(x, NAMES, observed, BASELINE, retirements, deliveries)
+    differences = _central_differences(residuals, x)
+    np.testing.assert_allclose(jacobian, differences, atol=1e-6 * np.abs(differences).max())
+
+    # Residuals of the model as run_scenario builds it
+    years = np.arange(BASELINE['start_year'], observed.index[-1] + 1)
+    stock = project_stock(years, observed, BASELINE['stock_target'], BASELINE['curve_mean_forecast'],
+                          BASELINE['curve_sd_forecast'], x[2], x[3])
+    curve = survival_curve(len(years), x[0], x[1])
+    model_stock = convolve_cohorts(solve_inflow_batch(stock[None], curve[None])[0], curve)[0]
+    np.testing.assert_allclose(values[:len(observed)], (model_stock[-len(observed):] - observed) / observed,
+                               rtol=1e-9, atol=1e-12)
+
+
+def test_backcast_jacobian_matches_central_differences(observed):
+    x = np.array([1985.0, 10.0])
+    residuals, jacobian = backcast_residuals(x[0], x[1], observed)
+    differences = _central_differences(lambda point: backcast_residuals(point[0], point[1], observed)[0], x)
+    np.testing.assert_allclose(jacobian, differences, rtol=1e-5, atol=1e-9)
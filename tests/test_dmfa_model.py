@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Checks of the dMFA scenario engine on the stock workbook.
+"""
+
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, str(Path(__file__).parents[1] / 'dMFA'))
+import dmfa_model
+from dmfa_model import LTE, history_checkpoint, load_inputs, run_scenario
+from dmfa_store import load_table, save_results
+
+
+@pytest.fixture(scope='module')
+def inputs():
+    return load_inputs()
+
+
+@pytest.fixture(scope='module')
+def by_resolution(inputs):
+    return {steps: run_scenario({'steps_per_year': steps}, inputs, vintage_matrices=False) for steps in (1, 4, 12)}
+
+
+@pytest.mark.parametrize('steps', [4, 12])
+def test_annual_totals_agree_across_step_resolutions(by_resolution, steps):
+    annual, fine = by_resolution[1], by_resolution[steps]
+    for table in ['planes_projection', 'titanium_projection']:
+        total, fine_total = annual[table]['inflow'].sum(), fine[table]['inflow'].sum()
+        assert fine_total == pytest.approx(total, rel=0.025)
+
+    # Sub-annual deliveries carry the titanium intensity of the year they are counted in
+    def per_plane(results):
+        return (results['titanium_projection']['inflow'] / results['planes_projection']['inflow']).iloc[1:]
+    np.testing.assert_allclose(per_plane(fine), per_plane(annual), rtol=1e-6)
+
+
+@pytest.mark.parametrize('steps', [1, 4])
+def test_cohorts_sum_to_the_stock_by_class(inputs, tmp_path, steps):
+    results = run_scenario({'steps_per_year': steps}, inputs, vintage_matrices=False, cohorts=True)
+    cohorts = results['titanium_stock_by_class_vintage']
+    by_class = results['titanium_stock_by_class']
+    summed = cohorts.T.groupby(level='class', sort=False).sum().T
+    np.testing.assert_allclose(summed[by_class.columns], by_class, rtol=1e-4, atol=1e-3 * by_class.to_numpy().max())
+
+    save_results({'name': 'cohorts', 'titanium_stock_by_class_vintage': cohorts}, db=tmp_path / 'results.sqlite')
+    stored = load_table('titanium_stock_by_class_vintage', db=tmp_path / 'results.sqlite').loc['cohorts']
+    np.testing.assert_allclose(stored.reindex(columns=cohorts.columns, fill_value=0.0), cohorts, rtol=1e-6)
+
+
+def test_input_cache_replaces_stale_versions(monkeypatch, tmp_path):
+    monkeypatch.setattr(dmfa_model, 'CACHE_DIR', tmp_path)
+    stale = tmp_path / f'{dmfa_model.INPUT_PATH.stem} - 0000000000000000.npz'
+    stale.write_bytes(b'')
+    # A stale cache that a parallel run removes between listing and unlinking
+    removed = tmp_path / f'{dmfa_model.INPUT_PATH.stem} - 1111111111111111.npz'
+    glob = Path.glob
+    monkeypatch.setattr(Path, 'glob', lambda self, pattern: [*glob(self, pattern), removed])
+
+    inputs = load_inputs()
+    cached = list(glob(tmp_path, '*.npz'))
+    assert len(cached) == 1 and cached[0] != stale
+
+    for name, table in load_inputs().items():
+        np.testing.assert_array_equal(table.to_numpy(dtype=float), inputs[name].to_numpy(dtype=float))
+    assert list(glob(tmp_path, '*.npz')) == cached
+
+
+def test_checkpoint_keeps_only_the_historical_survival_columns(inputs):
+    scenario = {**LTE, 'steps_per_year': 4}
+    checkpoint = history_checkpoint(scenario, inputs)
+    n_steps = len(checkpoint.survivors)
+    assert checkpoint.history_block.shape == (n_steps, checkpoint.last_step + 1)
+    np.testing.assert_array_equal(checkpoint.history_block, checkpoint.survival.dense()[:, :checkpoint.last_step + 1])
+
+    resumed = run_scenario(scenario, inputs, checkpoint=checkpoint)
+    full = run_scenario(scenario, inputs)
+    for table in ['planes_projection', 'titanium_projection', 'plane_stock_by_vintage']:
+        np.testing.assert_allclose(resumed[table].to_numpy(), full[table].to_numpy(), rtol=1e-9, atol=1e-9)
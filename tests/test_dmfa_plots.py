@@ -0,0 +1,40 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Checks of the figure rendering and its manifest fingerprints.
+"""
+
+import sys
+from pathlib import Path
+
+import matplotlib
+import matplotlib.pyplot as plt
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).parents[1] / 'dMFA'))
+from dmfa_plots import _fingerprint, line_figure, render_figures
+
+
+def _builder(body):
+    namespace = {}
+    exec(f'def figure(values):\n    return {body}\n', namespace)
+    return namespace['figure']
+
+
+def test_fingerprint_changes_with_the_builder_code():
+    args = {'values': np.arange(5.0)}
+    first, edited = _builder('values.sum()'), _builder('values.max()')
+    assert first.__qualname__ == edited.__qualname__
+    jobs = [{'file': 'figure.png', 'dpi': 100, 'figure': builder, 'args': args} for builder in (first, first, edited)]
+    fingerprints = [_fingerprint(job) for job in jobs]
+    assert fingerprints[0] == fingerprints[1]
+    assert fingerprints[0] != fingerprints[2]
+
+
+def test_serial_rendering_stays_off_pyplot(tmp_path):
+    backend = matplotlib.get_backend()
+    job = {'file': 'lines.png', 'dpi': 50, 'figure': line_figure,
+           'args': {'x': np.arange(10), 'lines': {'stock': np.arange(10.0)}}}
+    assert render_figures([job], tmp_path, max_workers=1) == ['lines.png']
+    assert (tmp_path / 'lines.png').stat().st_size > 0
+    assert plt.get_fignums() == [] and matplotlib.get_backend() == backend
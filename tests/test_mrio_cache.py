@@ -0,0 +1,40 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Checks of the binary table cache.
+"""
+
+import sys
+from pathlib import Path
+
+import pandas as pd
+import pytest
+
+sys.path.insert(0, str(Path(__file__).parents[1] / 'MRIO'))
+from mrio_cache import cached_tables
+
+
+def test_entry_is_extended_with_newly_requested_tables(tmp_path):
+    source = tmp_path / 'source.xlsx'
+    source.write_bytes(b'workbook')
+    tables = {name: pd.DataFrame([[i + 1.0]], index=['a'], columns=['a']) for i, name in enumerate(['Z', 'X', 'z'])}
+    builds = []
+
+    def builder(names):
+        def build():
+            builds.append(names)
+            return {name: tables[name] for name in names if name in tables}
+        return build
+
+    def cached(names):
+        return cached_tables([source], builder(names), names=names, cache_dir=tmp_path / 'Cache')
+
+    assert list(cached(['Z', 'X'])) == ['Z', 'X']
+    extended = cached(['Z', 'X', 'z'])
+    assert sorted(extended) == ['X', 'Z', 'z'] and extended['z'].iloc[0, 0] == 3.0
+    assert sorted(cached(['Z', 'z'])) == ['Z', 'z']
+    assert sorted(cached(['X'])) == ['X']
+    assert len(builds) == 2
+
+    with pytest.raises(KeyError, match='w'):
+        cached(['Z', 'w'])
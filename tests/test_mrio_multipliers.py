@@ -0,0 +1,37 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Checks of the multiplier queries on the baseline coefficients workbook.
+"""
+
+import gc
+import sys
+import weakref
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).parents[1] / 'MRIO'))
+from mrio_leontief import LeontiefSystem
+from mrio_multipliers import multipliers
+from mrio_scenarios import read_coefficients_workbook, TITANIUM
+
+
+@pytest.fixture(scope='module')
+def baseline():
+    return read_coefficients_workbook(Path(__file__).parents[1] / 'MRIO' / 'Baseline scenario.xlsx')
+
+
+def test_output_multipliers_match_the_inverse(baseline):
+    system = LeontiefSystem(baseline['z'], baseline['v'], baseline['e'])
+    expected = system.inverse()[TITANIUM].sum()
+    assert multipliers(system).output(TITANIUM).iloc[0] == pytest.approx(expected, rel=1e-12)
+
+
+def test_memoized_system_is_collected(baseline):
+    system = LeontiefSystem(baseline['z'], baseline['v'], baseline['e'])
+    multipliers(system).output(TITANIUM)
+    ref = weakref.ref(system)
+    del system
+    gc.collect()
+    assert ref() is None
@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Checks of the EXIOBASE archive reader on a small synthetic archive.
+"""
+
+import sys
+import zipfile
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, str(Path(__file__).parents[1] / 'MRIO'))
+from mrio_panel import indicators, panel, read_exiobase_zip
+
+STRESSORS = ['Taxes less subsidies on products purchased: Total',
+             'Compensation of employees; wages, salaries, & employers\' social contributions: Low-skilled',
+             'Employment: Low-skill male', 'Operating surplus: Remaining net operating surplus', 'CO2 - combustion - air']
+
+
+@pytest.fixture
+def archive(tmp_path):
+    sectors = pd.MultiIndex.from_product([['AT', 'BE'], ['Steel', 'Manufacturing of Titanium and articles thereof']],
+                                         names=['region', 'sector'])
+    demand = pd.MultiIndex.from_product([['AT', 'BE'], ['Households']], names=['region', 'category'])
+    rng = np.random.default_rng(0)
+    members = {
+        'Z.txt': pd.DataFrame(rng.uniform(0, 1, (4, 4)), index=sectors, columns=sectors),
+        'Y.txt': pd.DataFrame(rng.uniform(0, 1, (4, 2)), index=sectors, columns=demand),
+        'x.txt': pd.DataFrame({'indout': rng.uniform(5, 10, 4)}, index=sectors),
+        'satellite/F.txt': pd.DataFrame(np.arange(20.0).reshape(5, 4), index=pd.Index(STRESSORS, name='stressor'),
+                                        columns=sectors),
+        'satellite/F_Y.txt': pd.DataFrame(np.ones((5, 2)), index=pd.Index(STRESSORS, name='stressor'), columns=demand),
+    }
+    path = tmp_path / 'IOT_2020_ixi.zip'
+    with zipfile.ZipFile(path, 'w') as f:
+        for name, table in members.items():
+            f.writestr(f'IOT_2020_ixi/{name}', table.to_csv(sep='\t'))
+    return path
+
+
+def test_stressors_split_by_name(archive):
+    tables = read_exiobase_zip(archive)
+    assert list(tables.factors) == [STRESSORS[i] for i in (0, 1, 3)]
+    assert list(tables.accounts) == [STRESSORS[i] for i in (2, 4)]
+    np.testing.assert_array_equal(tables.flow('E').toarray(), np.arange(20.0).reshape(5, 4)[[2, 4]])
+
+    titanium = indicators(tables, accounts=['Employment: Low-skill male'])
+    np.testing.assert_array_equal(titanium['Employment: Low-skill male'], [9.0, 11.0])
+    with pytest.raises(KeyError, match='Employment people'):
+        indicators(tables)
+    with pytest.raises(ValueError, match='aggregation'):
+        panel({2020: archive}, max_workers=1)
+
+
+def test_panel_of_raw_archive(archive, tmp_path):
+    titanium = panel({2020: archive}, accounts=['Employment: Low-skill male'], max_workers=1, cache_dir=tmp_path / 'Cache')
+    assert titanium.index.get_level_values('Year').unique().tolist() == [2020]
+    np.testing.assert_array_equal(titanium['value_added'], [1.0 + 5.0 + 13.0, 3.0 + 7.0 + 15.0])
@@ -0,0 +1,28 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Checks of the stage instrumentation.
+"""
+
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, str(Path(__file__).parents[1] / 'dMFA'))
+import pipeline_profile
+
+
+@pytest.mark.skipif(not Path('/proc/self/clear_refs').exists(), reason='peak RSS is only reset per stage on Linux')
+def test_nested_stage_keeps_the_outer_peak():
+    pipeline_profile.reset()
+    with pipeline_profile._Stage('outer'):
+        before = pipeline_profile._peak_rss_mb()
+        block = np.ones(200 * 2 ** 20 // 8)  # 200 MB, touched
+        del block
+        with pipeline_profile._Stage('inner'):
+            pass
+    records = {record['stage']: record for record in pipeline_profile.take()}
+    assert records['outer']['peak_rss_mb'] >= before + 190
+    assert records['outer']['peak_rss_mb'] >= records['outer/inner']['peak_rss_mb']